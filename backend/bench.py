@@ -0,0 +1,541 @@
+# backend/bench.py: offline benchmarks for the history, suggest and stats pipelines (see "Benchmarks" in the README)
+import argparse
+import asyncio
+import csv
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from bisect import bisect_left, bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+import httpx
+import numpy as np
+import pandas as pd
+
+# The suites install their own stores; never touch the real cache, and only Stooq is served
+os.environ["HISTORY_CACHE_PATH"] = ""
+os.environ["PROVIDERS"] = "stooq"
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import main  # noqa: E402
+
+SUITES = ["parse", "history", "batch", "suggest", "stats", "memory"]
+SUGGEST_QUERIES = ["a", "ap", "aapl", "ms", "spy", "gold", "btc", "xl", "semi", "zz"]
+# Synthetic symbols carry their history length: S40Y0001 has 40 years of bars
+_SYNTHETIC_RE = re.compile(r"^s(\d+)y(\d+)(\.us)?$")
+_END_DAY = "2024-12-31"
+
+
+def synthetic_stooq_csv(years: int, seed: int = 0) -> str:
+	dates = pd.bdate_range(end=_END_DAY, periods=years * 252)
+	rng = np.random.default_rng(seed)
+	close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+	lines = ["Date,Open,High,Low,Close,Volume"]
+	lines += [f"{d:%Y-%m-%d},{c:.4f},{c * 1.01:.4f},{c * 0.99:.4f},{c:.4f},{1000 + i}" for i, (d, c) in enumerate(zip(dates, close))]
+	return "\n".join(lines)
+
+
+def synthetic_symbol(years: int, n: int) -> str:
+	return f"S{years}Y{n:04d}"
+
+
+# The symbol directory rows that synthetic search responses are drawn from
+def _directory() -> list[dict]:
+	try:
+		with open(main.SYMBOL_DIRECTORY_PATH, newline="", encoding="utf-8") as fh:
+			return list(csv.DictReader(fh))
+	except OSError:
+		return []
+
+
+# ---------------------------------------------------------------------------
+# Stand-in provider server
+# ---------------------------------------------------------------------------
+
+# Provider responses: recorded files from root first, synthesized otherwise
+class Fixtures:
+	def __init__(self, root: str = ""):
+		self.root = root
+		self._bars: dict[str, tuple[list[str], list[str], str]] = {}
+		self._directory = _directory()
+		stooq_dir = os.path.join(root, "stooq")
+		self._recorded_csvs = sorted(os.listdir(stooq_dir)) if root and os.path.isdir(stooq_dir) else []
+
+	def _recorded(self, kind: str, name: str, ext: str):
+		if not self.root:
+			return None
+		path = os.path.join(self.root, kind, quote(name, safe="") + ext)
+		try:
+			with open(path, encoding="utf-8") as fh:
+				return fh.read()
+		except OSError:
+			return None
+
+	# Rows of symbol between the YYYYMMDD bounds, like Stooq's d1/d2 window
+	def stooq_csv(self, symbol: str, d1: str, d2: str) -> str:
+		symbol = symbol.lower()
+		entry = self._bars.get(symbol)
+		if entry is None:
+			text = self._recorded("stooq", symbol, ".csv") or self._recorded("stooq", symbol.removesuffix(".us"), ".csv")
+			match = _SYNTHETIC_RE.match(symbol)
+			if text is None and match and self._recorded_csvs:
+				with open(os.path.join(self.root, "stooq", self._recorded_csvs[int(match.group(2)) % len(self._recorded_csvs)]), encoding="utf-8") as fh:
+					text = fh.read()
+			elif text is None and match:
+				text = synthetic_stooq_csv(int(match.group(1)), seed=zlib.crc32(symbol.removesuffix(".us").encode()))
+			if text is None:
+				return "No data"
+			header, _, body = text.strip().partition("\n")
+			lines = body.split("\n")
+			entry = self._bars[symbol] = ([ln[:10] for ln in lines], lines, header)
+		days, lines, header = entry
+		lo = bisect_left(days, f"{d1[:4]}-{d1[4:6]}-{d1[6:8]}") if d1 else 0
+		hi = bisect_right(days, f"{d2[:4]}-{d2[4:6]}-{d2[6:8]}") if d2 else len(days)
+		if lo >= hi:
+			return "No data"
+		return header + "\n" + "\n".join(lines[lo:hi]) + "\n"
+
+	def _matches(self, query: str) -> list[dict]:
+		q = query.strip().lower()
+		return [row for row in self._directory if row["symbol"].lower().startswith(q) or any(w.startswith(q) for w in row["name"].lower().split())]
+
+	def stooq_search(self, query: str) -> str:
+		recorded = self._recorded("stooq_search", query, ".html")
+		if recorded is not None:
+			return recorded
+		rows = "".join(
+			f"<tr><td><a href='/q/?s={r['symbol'].lower()}.us'>{r['symbol']}.US</a></td><td>{r['name']}</td><td>{r['exchange']}</td><td>{100 + i:.2f}</td><td>+0.{i}%</td></tr>"
+			for i, r in enumerate(self._matches(query)[:20])
+		)
+		return f"<html><body><table>{rows}</table></body></html>"
+
+	def yahoo_search(self, query: str) -> str:
+		recorded = self._recorded("yahoo_search", query, ".json")
+		if recorded is not None:
+			return recorded
+		quotes = [
+			{"symbol": r["symbol"], "shortname": r["name"], "quoteType": r["type"], "exchDisp": r["exchange"], "score": float(r["score"] or 0), "regularMarketPrice": 100.0 + i}
+			for i, r in enumerate(self._matches(query)[:20])
+		]
+		return json.dumps({"quotes": quotes, "news": []})
+
+
+def _fixture_handler(fixtures: Fixtures):
+	class Handler(BaseHTTPRequestHandler):
+		protocol_version = "HTTP/1.1"
+		# Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per response
+		disable_nagle_algorithm = True
+
+		def do_GET(self):
+			url = urlsplit(self.path)
+			params = {k: v[0] for k, v in parse_qs(url.query).items()}
+			if url.path == "/q/d/l/":
+				body, ctype = fixtures.stooq_csv(params.get("s", ""), params.get("d1", ""), params.get("d2", "")), "text/csv"
+			elif url.path == "/db/l/":
+				body, ctype = fixtures.stooq_search(params.get("q", "")), "text/html"
+			elif url.path == "/v1/finance/search":
+				body, ctype = fixtures.yahoo_search(params.get("q", "")), "application/json"
+			else:
+				self.send_error(404)
+				return
+			data = body.encode("utf-8")
+			self.send_response(200)
+			self.send_header("Content-Type", ctype)
+			self.send_header("Content-Length", str(len(data)))
+			self.end_headers()
+			self.wfile.write(data)
+
+		def log_message(self, *args):
+			pass
+
+	return Handler
+
+
+def _serve_fixtures(root: str, conn) -> None:
+	server = ThreadingHTTPServer(("127.0.0.1", 0), _fixture_handler(Fixtures(root)))
+	server.daemon_threads = True
+	conn.send(server.server_address[1])
+	server.serve_forever()
+
+
+# Sends every provider request to the stand-in server, keeping path and query
+class StandInTransport(httpx.AsyncBaseTransport):
+	def __init__(self, port: int):
+		self.port = port
+		limits = httpx.Limits(max_connections=main.HTTP_MAX_CONNECTIONS, max_keepalive_connections=main.HTTP_MAX_CONNECTIONS)
+		self._inner = httpx.AsyncHTTPTransport(limits=limits)
+
+	async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+		request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self.port)
+		return await self._inner.handle_async_request(request)
+
+	async def aclose(self) -> None:
+		await self._inner.aclose()
+
+
+# Save live provider responses for tickers and queries in the --fixtures layout
+def record_fixtures(root: str, tickers: list[str], queries: list[str]) -> None:
+	def save(kind: str, name: str, ext: str, text: str) -> None:
+		os.makedirs(os.path.join(root, kind), exist_ok=True)
+		with open(os.path.join(root, kind, quote(name, safe="") + ext), "w", encoding="utf-8") as fh:
+			fh.write(text)
+
+	with httpx.Client(timeout=30, follow_redirects=True) as client:
+		for ticker in tickers:
+			symbol = ticker.lower()
+			resp = client.get("https://stooq.com/q/d/l/", params={"s": symbol, "i": "d"}, headers={"User-Agent": "Mozilla/5.0"})
+			if resp.status_code == 200 and not resp.text.lower().startswith("no data"):
+				save("stooq", symbol, ".csv", resp.text)
+			print(f"stooq {symbol}: HTTP {resp.status_code}, {len(resp.content)} bytes")
+		for q in queries:
+			resp = client.get("https://stooq.com/db/l/", params={"q": q}, headers=main._STOOQ_HEADERS)
+			save("stooq_search", q, ".html", resp.text)
+			resp = client.get("https://query2.finance.yahoo.com/v1/finance/search", params={"q": q, "quotesCount": 40, "newsCount": 0}, headers=main._YAHOO_HEADERS)
+			save("yahoo_search", q, ".json", resp.text)
+			print(f"search {q!r}: saved")
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+async def _call(fn):
+	result = fn()
+	if inspect.isawaitable(result):
+		result = await result
+	return result
+
+
+# Wall-clock seconds of repeat calls of fn (sync or async), setup untimed before each
+async def measure(fn, repeat: int, setup=None) -> list[float]:
+	times = []
+	for _ in range(repeat):
+		if setup is not None:
+			setup()
+		t0 = time.perf_counter()
+		await _call(fn)
+		times.append(time.perf_counter() - t0)
+	return times
+
+
+# Peak bytes allocated while fn runs (tracemalloc sees numpy and pandas buffers and worker threads)
+async def peak_alloc(fn, setup=None) -> int:
+	if setup is not None:
+		setup()
+	tracemalloc.start()
+	try:
+		await _call(fn)
+		return tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+
+# Collects one record per (suite, stage, size) and prints it as a table row
+class Report:
+	COLUMNS = f"{'suite':<9}{'stage':<26}{'years':>6}{'tickers':>8}{'rows':>9}{'best ms':>10}{'median ms':>11}{'rows/s':>14}{'peak KiB':>11}"
+
+	def __init__(self):
+		self.results: list[dict] = []
+		self._suite = None
+
+	def add(self, suite: str, stage: str, *, years=None, tickers=None, rows: int = 0, times=None, peak=None) -> None:
+		if suite != self._suite:
+			print(("\n" if self._suite else "") + self.COLUMNS)
+			self._suite = suite
+		best = min(times) if times else None
+		rec = {
+			"suite": suite,
+			"stage": stage,
+			"years": years,
+			"tickers": tickers,
+			"rows": rows,
+			"best_ms": round(best * 1000, 4) if best is not None else None,
+			"median_ms": round(statistics.median(times) * 1000, 4) if times else None,
+			"rows_per_s": round(rows / best, 1) if best and rows else None,
+			"peak_kib": round(peak / 1024, 1) if peak is not None else None,
+		}
+		self.results.append(rec)
+
+		def cell(value, width, fmt):
+			return f"{'-':>{width}}" if value is None else f"{value:>{width}{fmt}}"
+
+		print(
+			f"{suite:<9}{stage:<26}{cell(years, 6, '')}{cell(tickers, 8, '')}{rows:>9}"
+			f"{cell(rec['best_ms'], 10, '.2f')}{cell(rec['median_ms'], 11, '.2f')}{cell(rec['rows_per_s'], 14, ',.0f')}{cell(rec['peak_kib'], 11, '.1f')}"
+		)
+
+	async def stage(self, suite: str, stage: str, fn, repeat: int, *, setup=None, **fields) -> None:
+		times = await measure(fn, repeat, setup)
+		self.add(suite, stage, times=times, peak=await peak_alloc(fn, setup), **fields)
+
+
+# ---------------------------------------------------------------------------
+# Suites
+# ---------------------------------------------------------------------------
+
+# Fresh history stores for cold runs, under one temporary directory
+class Workspace:
+	def __init__(self, root: str):
+		self.root = root
+		self._n = 0
+
+	def reset(self) -> None:
+		self._n += 1
+		path = os.path.join(self.root, f"store{self._n}")
+		main._history_store = main.HistoryStore(os.path.join(path, "history.sqlite3"))
+		main._column_files = main.ColumnFiles(os.path.join(path, "columns"))
+		main._series_cache = main.SeriesCache(main.HISTORY_MEMORY_CACHE_MB * 1024 * 1024)
+		main._negative_history = main.NegativeCache(main.HISTORY_NEGATIVE_TTL, main.HISTORY_NEGATIVE_MAX)
+
+
+def _range(years: int) -> tuple[str, str]:
+	return (pd.Timestamp(_END_DAY) - pd.DateOffset(years=years) + pd.Timedelta(days=1)).strftime("%Y-%m-%d"), _END_DAY
+
+
+async def bench_parse(report: Report, years_list, repeat: int) -> None:
+	for years in years_list:
+		text = synthetic_stooq_csv(years)
+		rows = text.count("\n")
+		parsed = main._parse_stooq_csv(text, "1900-01-01", "2100-01-01")
+		as_text = parsed.assign(date=parsed["date"].dt.strftime("%Y-%m-%d"))
+		raw = pd.read_csv(main.StringIO(text)).rename(columns=str.lower)
+		stages = {
+			"stooq_csv_parse": lambda: main._parse_stooq_csv(text, "2020-01-01", "2020-12-31"),
+			"normalize_ohlcv_df": lambda: main.normalize_ohlcv_df(raw.copy()),
+			"filter_parsed_dates": lambda: main.filter_date_range(parsed, "2020-01-01", "2020-12-31"),
+			"filter_string_dates": lambda: main.filter_date_range(as_text.copy(), "2020-01-01", "2020-12-31"),
+			"series_from_frame": lambda: main.BarSeries.from_frame(parsed),
+		}
+		for name, fn in stages.items():
+			await report.stage("parse", name, fn, repeat, years=years, rows=rows)
+
+
+async def bench_history(report: Report, ws: Workspace, years_list, repeat: int, asgi: httpx.AsyncClient) -> None:
+	for n, years in enumerate(years_list):
+		ticker = synthetic_symbol(max(years_list), n)
+		start, end = _range(years)
+		bars, _ = await main.resolve_history(ticker, start, end)
+		fields = {"years": years, "tickers": 1, "rows": len(bars)}
+		await report.stage("history", "resolve_cold", lambda: main.resolve_history(ticker, start, end), repeat, setup=ws.reset, **fields)
+		await report.stage("history", "resolve_warm", lambda: main.resolve_history(ticker, start, end), repeat, **fields)
+		await report.stage("history", "serialize_records", lambda: main._json_bytes(main.history_records(bars)), repeat, **fields)
+		await report.stage("history", "serialize_columns", lambda: main._json_bytes(main.history_columns(bars)), repeat, **fields)
+		await report.stage("history", "encode_binary", lambda: main.encode_columns({}, bars.days, {c: getattr(bars, c) for c in main._BAR_COLUMNS}), repeat, **fields)
+		params = {"ticker": ticker, "start": start, "end": end}
+		# httpx asks for gzip by default; endpoint_json opts out so it and endpoint_json_gzip measure different paths
+		for name, headers in (
+			("endpoint_json", {"Accept-Encoding": "identity"}),
+			("endpoint_json_gzip", {"Accept-Encoding": "gzip"}),
+			("endpoint_binary", {"Accept": main.COLUMNS_MEDIA_TYPE}),
+			("endpoint_ndjson", {"Accept": main.NDJSON_MEDIA_TYPE}),
+		):
+			await report.stage("history", name, lambda h=headers: asgi.get("/history", params=params, headers=h), repeat, **fields)
+
+
+async def bench_batch(report: Report, ws: Workspace, tickers_list, years: int, repeat: int, asgi: httpx.AsyncClient) -> None:
+	start, end = _range(years)
+	for count in tickers_list:
+		tickers = [synthetic_symbol(years, i) for i in range(count)]
+		frames, _, _ = await main.resolve_many(tickers, start, end)
+		fields = {"years": years, "tickers": count, "rows": sum(len(b) for b in frames.values())}
+		await report.stage("batch", "resolve_many_cold", lambda: main.resolve_many(tickers, start, end), repeat, setup=ws.reset, **fields)
+		await report.stage("batch", "resolve_many_warm", lambda: main.resolve_many(tickers, start, end), repeat, **fields)
+		await report.stage("batch", "align_history", lambda: main.align_history(frames), repeat, **fields)
+		body = {"tickers": tickers, "start": start, "end": end}
+		for name, headers in (
+			("endpoint_json", {"Accept-Encoding": "identity"}),
+			("endpoint_binary", {"Accept": main.COLUMNS_MEDIA_TYPE}),
+			("endpoint_ndjson", {"Accept": main.NDJSON_MEDIA_TYPE}),
+		):
+			await report.stage("batch", name, lambda h=headers: asgi.post("/history/batch", json=body, headers=h), repeat, **fields)
+
+
+async def bench_suggest(report: Report, repeat: int, asgi: httpx.AsyncClient) -> None:
+	limit = main.SUGGESTION_MAX_LIMIT
+	queries = SUGGEST_QUERIES
+	fields = {"rows": len(queries)}
+
+	def reset_cache() -> None:
+		main._suggestion_cache = main.SuggestionCache(main.SUGGESTION_CACHE_SIZE, main.SUGGESTION_CACHE_TTL)
+
+	async def upstream_all():
+		for q in queries:
+			await main.collect_suggestions(q, limit, deadline=30)
+
+	await report.stage("suggest", "collect_upstream", upstream_all, repeat, **fields)
+	fetched = {q: (await main._fetch_yahoo_suggestions(q, limit), await main._fetch_stooq_suggestions(q, limit)) for q in queries}
+	await report.stage("suggest", "merge_and_rank", lambda: [main._merge_suggestions(q, limit, y, s) for q, (y, s) in fetched.items()], repeat, **fields)
+	await report.stage("suggest", "local_index_search", lambda: [main._symbol_index.search(q, 12) for q in queries], repeat, **fields)
+
+	async def endpoint_all():
+		for q in queries:
+			await asgi.get("/suggest", params={"q": q})
+
+	await report.stage("suggest", "endpoint_cold", endpoint_all, repeat, setup=reset_cache, **fields)
+	await report.stage("suggest", "endpoint_cached", endpoint_all, repeat, **fields)
+
+
+async def bench_stats(report: Report, years_list, tickers_list, batch_years: int, repeat: int) -> None:
+	for years in years_list:
+		a, b = synthetic_symbol(max(years_list), 0), synthetic_symbol(max(years_list), 1)
+		start, end = _range(years)
+		_, prices, rets = await main.pair_returns(a, b, start, end)
+		x, y = rets.to_numpy()[:, 0].copy(), rets.to_numpy()[:, 1].copy()
+		fields = {"years": years, "tickers": 2, "rows": len(x)}
+		await report.stage("stats", "pair_returns_warm", lambda: main.pair_returns(a, b, start, end), repeat, **fields)
+		await report.stage("stats", "pair_stats", lambda: main.pair_stats(x, y), repeat, **fields)
+		await report.stage("stats", "rolling_30_90_252", lambda: main.rolling_pair_stats(x, y, [30, 90, 252]), repeat, **fields)
+	start, end = _range(batch_years)
+	for count in tickers_list:
+		if count < 2:
+			continue
+		frames, _, _ = await main.resolve_many([synthetic_symbol(batch_years, i) for i in range(count)], start, end)
+		rets = main.series_log_returns(frames)
+		values = rets.to_numpy()
+		fields = {"years": batch_years, "tickers": count, "rows": values.size}
+		await report.stage("stats", "series_log_returns", lambda: main.series_log_returns(frames), repeat, **fields)
+		await report.stage("stats", "pairwise_cov_corr", lambda: main.pairwise_cov_corr(values), repeat, **fields)
+
+
+# Per-request allocation for a stored symbol: old DataFrame read vs. views of shared or mapped series
+async def bench_memory(report: Report, years_list) -> None:
+	with tempfile.TemporaryDirectory() as tmp:
+		store = main.HistoryStore(os.path.join(tmp, "bench.sqlite3"))
+		files = main.ColumnFiles(os.path.join(tmp, "columns"))
+		for years in years_list:
+			df = main._parse_stooq_csv(synthetic_stooq_csv(years), "1900-01-01", "2100-01-01")
+			symbol = f"bench{years}"
+			start, end = df["date"].iloc[0].strftime("%Y-%m-%d"), df["date"].iloc[-1].strftime("%Y-%m-%d")
+			store.write("stooq", symbol, df, start, end)
+			shared = store.read_series("stooq", symbol)
+			files.save("stooq", symbol, shared)
+			stages = {
+				"sqlite_dataframe_read": lambda: store.read("stooq", symbol, start, end).dropna(subset=["open", "high", "low", "close"]),
+				"series_full_read": lambda: store.read_series("stooq", symbol),
+				"column_file_map": lambda: files.load("stooq", symbol).slice(start, end),
+				"series_slice_view": lambda: shared.slice(start, end),
+				"series_columns": lambda: main.history_columns(shared.slice(start, end)),
+			}
+			for name, fn in stages.items():
+				report.add("memory", name, years=years, rows=len(df), peak=await peak_alloc(fn))
+			report.add("memory", "series_resident", years=years, rows=len(df), peak=shared.nbytes)
+
+
+async def run_suites(args, report: Report) -> None:
+	suites = set(args.suites)
+	if "parse" in suites:
+		await bench_parse(report, args.years, args.repeat)
+	network = suites & {"history", "batch", "suggest", "stats"}
+	if network:
+		reader, writer = multiprocessing.Pipe(duplex=False)
+		server = multiprocessing.Process(target=_serve_fixtures, args=(args.fixtures or "", writer), daemon=True)
+		server.start()
+		try:
+			port = reader.recv()
+			main._http_client = httpx.AsyncClient(transport=StandInTransport(port), timeout=30)
+			asgi = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+			with tempfile.TemporaryDirectory() as tmp:
+				ws = Workspace(tmp)
+				ws.reset()
+				if "history" in suites:
+					await bench_history(report, ws, args.years, args.repeat, asgi)
+				if "batch" in suites:
+					await bench_batch(report, ws, args.tickers, args.batch_years, args.repeat, asgi)
+				if "stats" in suites:
+					await bench_stats(report, args.years, args.tickers, args.batch_years, args.repeat)
+				if "suggest" in suites:
+					await bench_suggest(report, args.repeat, asgi)
+			await asgi.aclose()
+			await main._http_client.aclose()
+		finally:
+			server.terminate()
+	if "memory" in suites:
+		await bench_memory(report, args.years)
+
+
+def _git_revision() -> str:
+	try:
+		return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=5).stdout.strip()
+	except (OSError, subprocess.SubprocessError):
+		return ""
+
+
+# Print stages whose best time grew by more than threshold against a saved run; return their count
+def compare(results: list[dict], baseline_path: str, threshold: float) -> int:
+	with open(baseline_path, encoding="utf-8") as fh:
+		baseline = json.load(fh)
+	key = lambda r: (r["suite"], r["stage"], r["years"], r["tickers"])  # noqa: E731
+	before = {key(r): r for r in baseline.get("results", [])}
+	regressions = 0
+	print(f"\nAgainst {baseline_path} ({baseline.get('meta', {}).get('revision') or 'unknown revision'}):")
+	for rec in results:
+		old = before.get(key(rec))
+		if not old or not old.get("best_ms") or not rec.get("best_ms"):
+			continue
+		ratio = rec["best_ms"] / old["best_ms"]
+		if ratio > threshold:
+			regressions += 1
+			print(f"  SLOWER {rec['suite']}/{rec['stage']} years={rec['years']} tickers={rec['tickers']}: {old['best_ms']:.2f} → {rec['best_ms']:.2f} ms (×{ratio:.2f})")
+		elif ratio < 1 / threshold:
+			print(f"  faster {rec['suite']}/{rec['stage']} years={rec['years']} tickers={rec['tickers']}: {old['best_ms']:.2f} → {rec['best_ms']:.2f} ms (×{ratio:.2f})")
+	print(f"  {regressions} stage(s) slower than ×{threshold}")
+	return regressions
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Offline benchmarks for the history, suggest and stats pipelines.")
+	parser.add_argument("--suites", nargs="+", choices=SUITES, default=[s for s in SUITES if s != "memory"])
+	parser.add_argument("--years", type=int, nargs="+", default=[1, 10, 40], help="history lengths for the per-ticker stages")
+	parser.add_argument("--tickers", type=int, nargs="+", default=[1, 10, 100, 500], help="batch sizes")
+	parser.add_argument("--batch-years", type=int, default=10, help="history length for the batch stages")
+	parser.add_argument("--repeat", type=int, default=5)
+	parser.add_argument("--memory", action="store_true", help="also run the memory suite")
+	parser.add_argument("--fixtures", default="", help="directory of recorded provider responses")
+	parser.add_argument("--record", metavar="DIR", help="record live responses for --record-tickers and the suggest queries into DIR, then exit")
+	parser.add_argument("--record-tickers", nargs="+", default=["aapl.us", "msft.us", "spy.us"])
+	parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+	parser.add_argument("--compare", metavar="PATH", help="baseline JSON from an earlier --json run")
+	parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio --compare reports as a regression")
+	args = parser.parse_args()
+	if args.record:
+		record_fixtures(args.record, args.record_tickers, SUGGEST_QUERIES)
+		sys.exit(0)
+	if args.memory and "memory" not in args.suites:
+		args.suites.append("memory")
+	main.logger.setLevel(logging.WARNING)
+	logging.getLogger("httpx").setLevel(logging.WARNING)
+
+	report = Report()
+	asyncio.run(run_suites(args, report))
+	document = {
+		"meta": {
+			"revision": _git_revision(),
+			"timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+			"python": platform.python_version(),
+			"numpy": np.__version__,
+			"pandas": pd.__version__,
+			"orjson": main.orjson is not None,
+			"fixtures": args.fixtures or "synthetic",
+			"args": {k: v for k, v in vars(args).items() if k not in {"json", "compare", "record"}},
+		},
+		"results": report.results,
+	}
+	if args.json == "-":
+		json.dump(document, sys.stdout, indent=1)
+		print()
+	elif args.json:
+		with open(args.json, "w", encoding="utf-8") as fh:
+			json.dump(document, fh, indent=1)
+	if args.compare and compare(report.results, args.compare, args.threshold):
+		sys.exit(1)
@@ -1,23 +1,68 @@
 # backend/main.py
-from fastapi import FastAPI, HTTPException, Query
-import yfinance as yf
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime
-from typing import List, Optional
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.datastructures import MutableHeaders
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, List, Literal, Optional
+from pydantic import BaseModel, Field
 import pandas as pd
+import numpy as np
 import math
+import random
+import mmap
 import os
 import logging
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import httpx
+import json
 import html
+import asyncio
+import bisect
+import csv
+import hashlib
+import heapq
 import re
+import sqlite3
+import struct
+import threading
 import time
+import contextvars
+import zlib
+from collections import Counter, OrderedDict
+from io import StringIO
+from urllib.parse import quote as quote_url
+from contextlib import aclosing, asynccontextmanager, contextmanager
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+try:
+	import orjson
+except ImportError:  # optional: stdlib json is used when orjson is missing
+	orjson = None
+
+try:
+	import fcntl
+except ImportError:  # Windows: the prefetch lock file is locked with msvcrt instead
+	fcntl = None
+	import msvcrt
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	prefetch = asyncio.create_task(_prefetch_loop()) if _prefetch_enabled() and _claim_prefetch_lock() else None
+	yield
+	if prefetch is not None:
+		prefetch.cancel()
+		try:
+			await prefetch
+		except asyncio.CancelledError:
+			pass
+		_prefetch_lock.close()
+	if _http_client is not None:
+		await _http_client.aclose()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Logger
 logger = logging.getLogger(__name__)
@@ -28,6 +73,35 @@ if not logger.handlers:
 def healthz():
     return {"status": "ok"}
 
+
+@app.get("/providers/health")
+def providers_health():
+	return {
+		"order": _provider_health.order([p.strip().lower() for p in os.getenv("PROVIDERS", "stooq,yahoo").split(",") if p.strip()]),
+		"providers": _provider_health.stats(),
+		"negative_cache": {"entries": len(_negative_history), "skipped": _negative_history.skipped},
+	}
+
+
+# Prometheus text exposition of this worker's latencies and cache/upstream counters
+@app.get("/metrics")
+def metrics():
+	extra: List[tuple[str, dict, float]] = []
+	for flight in (_history_flights, _suggest_flights):
+		extra.append(("singleflight_calls_total", {"flight": flight.name, "result": "started"}, flight.started))
+		extra.append(("singleflight_calls_total", {"flight": flight.name, "result": "coalesced"}, flight.coalesced))
+	cache = _suggestion_cache.stats()
+	for event in ("hits", "prefix_hits", "misses", "evictions", "expirations"):
+		extra.append(("suggest_cache_events_total", {"event": event}, cache[event]))
+	extra.append(("suggest_cache_entries", {}, cache["entries"]))
+	extra.append(("history_negative_cache_entries", {}, len(_negative_history)))
+	extra.append(("history_negative_cache_skipped_total", {}, _negative_history.skipped))
+	extra.append(("history_series_cache_bytes", {}, _series_cache.bytes))
+	for provider, st in _provider_health.stats().items():
+		extra.append(("provider_breaker_open", {"provider": provider}, int(st["open"])))
+		extra.append(("provider_consecutive_failures", {"provider": provider}, st["consecutive_failures"]))
+	return PlainTextResponse(_metrics.render(extra), media_type="text/plain; version=0.0.4")
+
 	
 # Allow CORS origins to be configured via env var (comma-separated)
 _env_origins = os.getenv("ALLOW_ORIGINS")
@@ -49,6 +123,62 @@ app.add_middleware(
     max_age=86400,
 )
 
+# Responses of at least GZIP_MIN_SIZE bytes are gzip-compressed for clients that accept it (negative disables)
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+GZIP_LEVEL = min(9, max(1, int(os.getenv("GZIP_LEVEL", "5"))))
+# Rows per NDJSON line when /history streams
+HISTORY_STREAM_CHUNK = max(1, int(os.getenv("HISTORY_STREAM_CHUNK", "1000")))
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+if GZIP_MIN_SIZE >= 0:
+	app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=GZIP_LEVEL)
+# Server-Timing header with per-stage durations: "1" on every response, "request" when the request sends X-Server-Timing, "0" never
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0").strip().lower()
+# Upper bounds (seconds) of the latency histogram buckets on /metrics
+METRICS_BUCKETS = tuple(sorted(float(b) for b in os.getenv("METRICS_BUCKETS", "0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10").split(",") if b.strip()))
+
+
+# Upper bound on tickers per /history/batch call and on concurrent provider lookups it runs
+HISTORY_BATCH_MAX_TICKERS = int(os.getenv("HISTORY_BATCH_MAX_TICKERS", "500"))
+HISTORY_BATCH_CONCURRENCY = max(1, int(os.getenv("HISTORY_BATCH_CONCURRENCY", "16")))
+# Provider × symbol-variant candidates loaded at once per ticker, and the delay before each extra one starts
+HISTORY_RACE_WIDTH = max(1, int(os.getenv("HISTORY_RACE_WIDTH", "4")))
+HISTORY_HEDGE_DELAY = max(0.0, float(os.getenv("HISTORY_HEDGE_DELAY", "0.25")))
+# How long a (provider, symbol) lookup that returned no data is skipped, and how many such misses are kept
+HISTORY_NEGATIVE_TTL = float(os.getenv("HISTORY_NEGATIVE_TTL", "300"))
+HISTORY_NEGATIVE_MAX = max(1, int(os.getenv("HISTORY_NEGATIVE_MAX", "10000")))
+# Consecutive upstream failures that move a provider to the back of PROVIDERS, and for how long
+PROVIDER_BREAKER_FAILURES = max(1, int(os.getenv("PROVIDER_BREAKER_FAILURES", "5")))
+PROVIDER_BREAKER_COOLDOWN = float(os.getenv("PROVIDER_BREAKER_COOLDOWN", "60"))
+# Exchange session (local wall-clock times, Monday–Friday) after which the day's bars are final
+MARKET_TIMEZONE = os.getenv("MARKET_TIMEZONE", "America/New_York")
+MARKET_OPEN = os.getenv("MARKET_OPEN", "09:30")
+MARKET_CLOSE = os.getenv("MARKET_CLOSE", "16:00")
+# Cache-Control max-age (seconds) of /history and /correlation while the latest bar can still move, and once it has settled
+HTTP_CACHE_LIVE_MAX_AGE = max(0, int(os.getenv("HTTP_CACHE_LIVE_MAX_AGE", "60")))
+HTTP_CACHE_MAX_AGE = max(0, int(os.getenv("HTTP_CACHE_MAX_AGE", "86400")))
+# Background warm-up: tickers always refreshed after the close, plus this many of the most requested ones
+PREFETCH_TICKERS = [t.strip() for t in os.getenv("PREFETCH_TICKERS", "").split(",") if t.strip()]
+PREFETCH_TOP_N = max(0, int(os.getenv("PREFETCH_TOP_N", "25")))
+# Days of history, ending today, that the warm-up keeps stored for each ticker
+PREFETCH_LOOKBACK_DAYS = max(1, int(os.getenv("PREFETCH_LOOKBACK_DAYS", "3650")))
+# Minutes after MARKET_CLOSE the warm-up starts, its concurrent lookups and the random delay (seconds) before each
+PREFETCH_DELAY_MINUTES = max(0, int(os.getenv("PREFETCH_DELAY_MINUTES", "30")))
+PREFETCH_CONCURRENCY = max(1, int(os.getenv("PREFETCH_CONCURRENCY", "2")))
+PREFETCH_JITTER = max(0.0, float(os.getenv("PREFETCH_JITTER", "20")))
+# Seconds after startup before the first warm-up; negative disables the scheduler
+PREFETCH_STARTUP_DELAY = float(os.getenv("PREFETCH_STARTUP_DELAY", "15"))
+# Distinct tickers whose request counts are tracked for the learned part of the watchlist
+PREFETCH_DEMAND_MAX = max(1, int(os.getenv("PREFETCH_DEMAND_MAX", "5000")))
+ROLLING_MAX_WINDOWS = 8
+# Monte Carlo limits: paths per request, horizon in days and total draws (paths × steps)
+SIM_MAX_PATHS = int(os.getenv("SIM_MAX_PATHS", "250000"))
+SIM_MAX_STEPS = int(os.getenv("SIM_MAX_STEPS", "520"))
+SIM_MAX_DRAWS = int(os.getenv("SIM_MAX_DRAWS", "5000000"))
+SIM_MAX_BASKET = int(os.getenv("SIM_MAX_BASKET", "200"))
+# Simulations computed at once per worker; each holds a few arrays of SIM_MAX_DRAWS floats
+SIM_CONCURRENCY = max(1, int(os.getenv("SIM_CONCURRENCY", "2")))
+_simulation_slots = asyncio.Semaphore(SIM_CONCURRENCY)
+
 
 class OHLCV(BaseModel):
 	date: str
@@ -64,6 +194,38 @@ class HistoryResponse(BaseModel):
 	data: List[OHLCV]
 
 
+class HistoryBatchRequest(BaseModel):
+	tickers: List[str] = Field(..., min_length=1, max_length=HISTORY_BATCH_MAX_TICKERS)
+	start: str
+	end: str
+	field: Literal["open", "high", "low", "close", "volume"] = "close"
+	align: Literal["inner", "outer"] = "inner"
+	refresh: bool = False
+
+
+class CorrelationMatrixRequest(BaseModel):
+	tickers: List[str] = Field(..., min_length=2, max_length=HISTORY_BATCH_MAX_TICKERS)
+	start: str
+	end: str
+	min_periods: int = Field(2, ge=2)
+	refresh: bool = False
+
+
+class BasketSimulationRequest(BaseModel):
+	tickers: List[str] = Field(..., min_length=2, max_length=SIM_MAX_BASKET)
+	start: str
+	end: str
+	shocks: dict[str, float] = Field(..., min_length=1, description="Log-return shock per ticker")
+	steps: int = Field(30, ge=1, le=SIM_MAX_STEPS)
+	paths: int = Field(10000, ge=1, le=SIM_MAX_PATHS)
+	shock_step: Optional[int] = Field(None, ge=1)
+	vol_scale: float = Field(1.2, gt=0)
+	quantiles: List[float] = [0.05, 0.5, 0.95]
+	seed: Optional[int] = Field(None, ge=0)
+	min_periods: int = Field(20, ge=2)
+	refresh: bool = False
+
+
 class Suggestion(BaseModel):
 	symbol: str
 	name: str
@@ -74,26 +236,289 @@ class Suggestion(BaseModel):
 
 
 SUGGESTION_CACHE_TTL = int(os.getenv("SUGGESTION_CACHE_TTL", "300"))
-_suggestion_cache: dict[tuple[str, int], tuple[float, List[dict]]] = {}
-_suggestion_session = requests.Session()
-_suggestion_session.headers.update({
-	"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+SUGGESTION_CACHE_SIZE = max(1, int(os.getenv("SUGGESTION_CACHE_SIZE", "2048")))
+# Seconds /suggest waits for upstream providers before answering with what has arrived
+SUGGEST_DEADLINE = float(os.getenv("SUGGEST_DEADLINE", "2.5"))
+# Largest `limit` /suggest accepts; upstream lookups always fetch this many so any smaller limit is a slice
+SUGGESTION_MAX_LIMIT = 40
+# Local symbol directory behind /suggest; re-read when the file changes (checked every SYMBOL_DIRECTORY_REFRESH seconds)
+SYMBOL_DIRECTORY_PATH = os.getenv("SYMBOL_DIRECTORY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "symbols.csv"))
+SYMBOL_DIRECTORY_REFRESH = float(os.getenv("SYMBOL_DIRECTORY_REFRESH", "3600"))
+# Symbols learned from upstream search results that the local index keeps on top of the directory
+SYMBOL_INDEX_MAX_LEARNED = max(0, int(os.getenv("SYMBOL_INDEX_MAX_LEARNED", "20000")))
+# SQLite file holding cached daily bars; set to an empty string to disable the store
+HISTORY_CACHE_PATH = os.getenv("HISTORY_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "history.sqlite3"))
+# Directory of per-symbol binary column files that every worker memory-maps; empty disables them (the default on Windows)
+HISTORY_COLUMNS_DIR = os.getenv("HISTORY_COLUMNS_DIR", os.path.join(os.path.dirname(HISTORY_CACHE_PATH), "columns") if HISTORY_CACHE_PATH and os.name != "nt" else "")
+# In-process cache of stored series that requests slice without copying, in megabytes
+HISTORY_MEMORY_CACHE_MB = max(0, int(os.getenv("HISTORY_MEMORY_CACHE_MB", "64")))
+# Days before the last cached bar that a tail refresh re-downloads to catch provider corrections
+HISTORY_REFRESH_OVERLAP_DAYS = max(1, int(os.getenv("HISTORY_REFRESH_OVERLAP_DAYS", "7")))
+# Relative close-price difference in the overlap window that counts as a restatement
+HISTORY_RESTATEMENT_TOLERANCE = float(os.getenv("HISTORY_RESTATEMENT_TOLERANCE", "1e-6"))
+# Shared upstream HTTP client: one keep-alive pool for every provider call
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_PER_HOST = max(1, int(os.getenv("HTTP_MAX_PER_HOST", "32")))
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+_BROWSER_UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+_STOOQ_HEADERS = {
+	"User-Agent": _BROWSER_UA,
 	"Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
 	"Accept-Language": "en-US,en;q=0.8",
-	"Connection": "keep-alive",
 	"Referer": "https://stooq.com/",
-})
-_suggestion_session.mount("https://", HTTPAdapter(max_retries=Retry(total=2, backoff_factor=0.4, status_forcelist=[429, 500, 502, 503, 504])))
-
-_yahoo_suggestion_session = requests.Session()
-_yahoo_suggestion_session.headers.update({
-	"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+}
+_YAHOO_HEADERS = {
+	"User-Agent": _BROWSER_UA,
 	"Accept": "application/json",
 	"Accept-Language": "en-US,en;q=0.9",
-	"Connection": "keep-alive",
 	"Referer": "https://finance.yahoo.com/",
-})
-_yahoo_suggestion_session.mount("https://", HTTPAdapter(max_retries=Retry(total=2, backoff_factor=0.4, status_forcelist=[429, 500, 502, 503, 504])))
+}
+_http_client: Optional[httpx.AsyncClient] = None
+_host_slots: dict[str, asyncio.Semaphore] = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+	global _http_client
+	if _http_client is None or _http_client.is_closed:
+		_http_client = httpx.AsyncClient(
+			timeout=httpx.Timeout(HTTP_TIMEOUT, connect=min(HTTP_TIMEOUT, 5.0)),
+			limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS, keepalive_expiry=60.0),
+			follow_redirects=True,
+		)
+	return _http_client
+
+
+# GET through the shared client, capped per host and retried on throttling/5xx
+async def http_get(url: str, *, params: Optional[dict] = None, headers: Optional[dict] = None, timeout: Optional[float] = None, retries: int = 2, backoff: float = 0.4) -> httpx.Response:
+	host = httpx.URL(url).host
+	slots = _host_slots.get(host)
+	if slots is None:
+		slots = _host_slots.setdefault(host, asyncio.Semaphore(HTTP_MAX_PER_HOST))
+	client = get_http_client()
+	for attempt in range(retries + 1):
+		started = time.perf_counter()
+		try:
+			async with slots:
+				resp = await client.get(url, params=params, headers=headers, timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT)
+		except httpx.TransportError:
+			_metrics.inc("upstream_requests_total", host=host, status="error")
+			if attempt >= retries:
+				raise
+		else:
+			_metrics.observe("upstream_request_duration_seconds", time.perf_counter() - started, host=host)
+			_metrics.inc("upstream_requests_total", host=host, status=str(resp.status_code))
+			if resp.status_code not in _RETRY_STATUSES or attempt >= retries:
+				return resp
+		await asyncio.sleep(backoff * (2 ** attempt))
+	raise RuntimeError("unreachable")
+
+
+def _prom_number(value: float) -> str:
+	if value == math.inf:
+		return "+Inf"
+	return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _prom_labels(labels: tuple) -> str:
+	if not labels:
+		return ""
+	escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in labels)
+	return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+# In-process counters and latency histograms in Prometheus text format; labels must come from small fixed sets, never tickers
+class Metrics:
+	def __init__(self, buckets: tuple[float, ...]):
+		self.buckets = buckets
+		self._kinds: dict[str, tuple[str, str]] = {}
+		self._counters: dict[tuple, float] = {}
+		self._histograms: dict[tuple, list] = {}
+		self._lock = threading.Lock()
+
+	def describe(self, name: str, kind: str, text: str) -> None:
+		self._kinds[name] = (kind, text)
+
+	def inc(self, name: str, amount: float = 1.0, **labels) -> None:
+		key = (name, tuple(sorted(labels.items())))
+		with self._lock:
+			self._counters[key] = self._counters.get(key, 0.0) + amount
+
+	def observe(self, name: str, value: float, **labels) -> None:
+		key = (name, tuple(sorted(labels.items())))
+		slot = bisect.bisect_left(self.buckets, value)
+		with self._lock:
+			hist = self._histograms.get(key)
+			if hist is None:
+				# One count per bucket (the last is +Inf), then the sum
+				hist = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+			hist[slot] += 1
+			hist[-1] += value
+
+	# Exposition text of every series plus extra (name, labels, value) samples read from elsewhere
+	def render(self, extra: List[tuple[str, dict, float]] = ()) -> str:
+		samples: dict[str, list] = {}
+		with self._lock:
+			for (name, labels), value in self._counters.items():
+				samples.setdefault(name, []).append((name, labels, value))
+			for (name, labels), hist in self._histograms.items():
+				rows = samples.setdefault(name, [])
+				total = 0
+				for bound, n in zip(self.buckets + (math.inf,), hist):
+					total += n
+					rows.append((f"{name}_bucket", labels + (("le", _prom_number(bound)),), total))
+				rows.append((f"{name}_sum", labels, hist[-1]))
+				rows.append((f"{name}_count", labels, total))
+		for name, labels, value in extra:
+			samples.setdefault(name, []).append((name, tuple(sorted(labels.items())), value))
+		lines: List[str] = []
+		for name in sorted(samples):
+			kind, text = self._kinds.get(name, ("untyped", ""))
+			if text:
+				lines.append(f"# HELP {name} {text}")
+			lines.append(f"# TYPE {name} {kind}")
+			lines.extend(f"{sample}{_prom_labels(labels)} {_prom_number(value)}" for sample, labels, value in samples[name])
+		return "\n".join(lines) + "\n"
+
+
+_metrics = Metrics(METRICS_BUCKETS)
+for _name, _kind, _text in (
+	("http_request_duration_seconds", "histogram", "Time to serve a request, by handler, method and status."),
+	("stage_duration_seconds", "histogram", "Time spent in each stage of a request (see span()), by stage and provider."),
+	("upstream_request_duration_seconds", "histogram", "Yahoo/Stooq response time per attempt, by host."),
+	("upstream_requests_total", "counter", "Upstream attempts by host and HTTP status (\"error\" for network failures)."),
+	("history_provider_attempts_total", "counter", "History fetches per provider symbol by outcome."),
+	("history_cache_requests_total", "counter", "History loads by cache result: hit, partial (some ranges fetched), miss or bypass."),
+	("history_series_cache_total", "counter", "Stored-series reads served from worker memory (hit) or read from disk (miss)."),
+	("history_resolutions_total", "counter", "Ticker lookups by winning provider and symbol-variant rank (provider \"none\" when nothing had data)."),
+	("history_variant_misses_total", "counter", "Provider symbol variants that came back empty before a lookup resolved, by provider and variant rank."),
+	("suggest_requests_total", "counter", "/suggest answers by source: cache, local index or upstream."),
+	("suggest_upstream_total", "counter", "Suggestion source lookups by outcome: ok, error, or late (missed SUGGEST_DEADLINE)."),
+	("singleflight_calls_total", "counter", "Coalesced loads: calls that started the work or joined one in flight."),
+	("suggest_cache_events_total", "counter", "Suggestion cache lookups and removals by event."),
+	("suggest_cache_entries", "gauge", "Queries held in the suggestion cache."),
+	("history_negative_cache_entries", "gauge", "Provider symbols remembered as empty."),
+	("history_negative_cache_skipped_total", "counter", "Upstream fetches skipped thanks to the negative cache."),
+	("history_series_cache_bytes", "gauge", "Bytes of bars held in this worker's series cache."),
+	("provider_breaker_open", "gauge", "1 while a provider's circuit breaker is open."),
+	("provider_consecutive_failures", "gauge", "Upstream failures in a row per provider."),
+):
+	_metrics.describe(_name, _kind, _text)
+
+# Per-request (stage, seconds) list that span() appends to; None when Server-Timing is off
+_request_timings: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_timings", default=None)
+
+
+# Time a block into stage_duration_seconds and the current request's Server-Timing (tasks and to_thread inherit the request)
+@contextmanager
+def span(stage: str, provider: str = ""):
+	started = time.perf_counter()
+	try:
+		yield
+	finally:
+		elapsed = time.perf_counter() - started
+		_metrics.observe("stage_duration_seconds", elapsed, stage=stage, provider=provider)
+		timings = _request_timings.get()
+		if timings is not None:
+			timings.append((stage, elapsed))
+
+
+# Milliseconds per stage, summed over repeats (counted in desc), then the total
+def _server_timing(timings: List[tuple[str, float]], total: float) -> str:
+	stages: dict[str, list] = {}
+	for stage, seconds in timings:
+		entry = stages.setdefault(stage, [0.0, 0])
+		entry[0] += seconds
+		entry[1] += 1
+	parts = [f"{stage};dur={secs * 1000.0:.1f}" + (f';desc="{n}x"' if n > 1 else "") for stage, (secs, n) in stages.items()]
+	parts.append(f"total;dur={total * 1000.0:.1f}")
+	return ", ".join(parts)
+
+
+def _wants_server_timing(scope: dict) -> bool:
+	if SERVER_TIMING in {"1", "true", "yes"}:
+		return True
+	if SERVER_TIMING != "request":
+		return False
+	return any(k == b"x-server-timing" and v not in {b"0", b"false"} for k, v in scope["headers"])
+
+
+# Plain ASGI so streamed bodies pass through; Server-Timing leaves with the response start
+class RequestMetricsMiddleware:
+	def __init__(self, app):
+		self.app = app
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http":
+			await self.app(scope, receive, send)
+			return
+		started = time.perf_counter()
+		timings = [] if _wants_server_timing(scope) else None
+		token = _request_timings.set(timings)
+		status = 500
+
+		async def send_with_timing(message):
+			nonlocal status
+			if message["type"] == "http.response.start":
+				status = message["status"]
+				if timings is not None:
+					headers = MutableHeaders(scope=message)
+					headers.append("Server-Timing", _server_timing(timings, time.perf_counter() - started))
+					headers.append("Timing-Allow-Origin", ", ".join(allow_origins))
+			await send(message)
+
+		try:
+			await self.app(scope, receive, send_with_timing)
+		finally:
+			_request_timings.reset(token)
+			# The router leaves the matched endpoint in the scope; unmatched paths share one series
+			handler = getattr(scope.get("endpoint"), "__name__", "unmatched")
+			_metrics.observe("http_request_duration_seconds", time.perf_counter() - started, handler=handler, method=scope["method"], status=str(status))
+
+
+app.add_middleware(RequestMetricsMiddleware)
+
+
+# Coalesce concurrent calls with the same key into one task; it is cancelled only once every waiter has gone
+class SingleFlight:
+	def __init__(self, name: str):
+		self.name = name
+		self._inflight: dict[tuple, asyncio.Task] = {}
+		self._waiters: dict[asyncio.Task, int] = {}
+		self.started = 0
+		self.coalesced = 0
+
+	async def run(self, key: tuple, factory):
+		task = self._inflight.get(key)
+		if task is None:
+			task = asyncio.ensure_future(factory())
+			self._inflight[key] = task
+			self.started += 1
+			task.add_done_callback(lambda t, k=key: self._forget(k, t))
+		else:
+			self.coalesced += 1
+		self._waiters[task] = self._waiters.get(task, 0) + 1
+		try:
+			return await asyncio.shield(task)
+		finally:
+			left = self._waiters.pop(task) - 1
+			if left:
+				self._waiters[task] = left
+			elif not task.done():
+				# Forget it right away so a new caller starts fresh instead of joining a cancelled task
+				if self._inflight.get(key) is task:
+					del self._inflight[key]
+				task.cancel()
+
+	def _forget(self, key: tuple, task: asyncio.Task) -> None:
+		if self._inflight.get(key) is task:
+			del self._inflight[key]
+		if not task.cancelled():
+			task.exception()  # mark retrieved when every waiter went away
+
+	def __len__(self) -> int:
+		return len(self._inflight)
+
 
 _ROW_RE = re.compile(r"<tr[^>]*>(.*?)</tr>", re.I | re.S)
 _CELL_RE = re.compile(r"<td[^>]*>(.*?)</td>", re.I | re.S)
@@ -278,35 +703,197 @@ def _compute_popularity_score(quote: dict, order: int) -> float:
 	return score_val
 
 
-def _maybe_add_interest_rate_suggestions(query: str, merged: dict[str, dict]) -> None:
-	q = (query or "").strip().lower()
-	if not q:
-		return
-	for entry in INTEREST_RATE_SUGGESTIONS:
-		symbol = entry.get("symbol")
-		if not symbol or symbol in merged:
-			continue
-		tokens = [symbol.lower(), entry.get("name", "").lower()]
-		tokens.extend(entry.get("keywords", []))
-		code = symbol[4:6].lower() if len(symbol) >= 6 else ""
-		if code:
-			tokens.append(code)
-		if any(q in token for token in tokens if token):
-			item = {k: v for k, v in entry.items() if k not in {"keywords", "priority"}}
-			item["_score"] = entry.get("priority", 320.0)
-			merged[symbol] = item
-	return
-
-
-def _fetch_stooq_html(query: str) -> str:
+_INDEX_WORD_RE = re.compile(r"[0-9a-z]+")
+
+
+# Lower-cased strings a query can be a prefix of to find entry
+def _index_tokens(entry: dict, extra: tuple[str, ...] = ()) -> set[str]:
+	symbol = entry["symbol"].lower()
+	tokens = {symbol, symbol.split(".")[0], symbol.lstrip("^")}
+	alias = (entry.get("alias_of") or "").lower()
+	if alias:
+		tokens.update((alias, alias.lstrip("^")))
+	name = (entry.get("name") or "").lower()
+	if name:
+		tokens.add(name)
+		tokens.update(_INDEX_WORD_RE.findall(name))
+	tokens.update(t.lower() for t in extra)
+	tokens.discard("")
+	return tokens
+
+
+# Prefix index over the symbol directory, rate series and learned Yahoo symbols, as one sorted (token, symbol) list
+class SymbolIndex:
+	def __init__(self, path: str, refresh: float, max_learned: int):
+		self.path = path
+		self.refresh = refresh
+		self.max_learned = max_learned
+		self._learned: OrderedDict[str, dict] = OrderedDict()
+		self._mtime: Optional[float] = None
+		self._checked = time.time()
+		self._entries, self._tokens, self._keys = self._build([])
+		try:
+			self._mtime = os.path.getmtime(path)
+		except OSError:
+			pass
+
+	def _read_directory(self) -> List[dict]:
+		rows: List[dict] = []
+		try:
+			with open(self.path, newline="", encoding="utf-8") as fh:
+				for order, row in enumerate(csv.DictReader(fh)):
+					raw_symbol = (row.get("symbol") or "").strip()
+					if not raw_symbol:
+						continue
+					quote = {"quoteType": (row.get("type") or "").strip().upper(), "score": row.get("score")}
+					symbol, alias = _remap_suggestion_symbol(raw_symbol, quote)
+					entry = {
+						"symbol": symbol.upper(),
+						"name": (row.get("name") or "").strip() or symbol.upper(),
+						"exchange": (row.get("exchange") or "").strip() or None,
+						"score": _compute_popularity_score(quote, order),
+					}
+					if alias and alias.upper() != entry["symbol"]:
+						entry["alias_of"] = alias.upper()
+					rows.append(entry)
+		except OSError as ex:
+			logger.warning(f"Symbol directory {self.path} unavailable: {ex}")
+		return rows
+
+	def _build(self, learned: List[dict]) -> tuple[dict[str, dict], dict[str, set[str]], List[tuple[str, str]]]:
+		entries: dict[str, dict] = {}
+		tokens: dict[str, set[str]] = {}
+
+		def add(entry: dict, extra: tuple[str, ...] = ()) -> None:
+			symbol = entry["symbol"]
+			current = entries.get(symbol)
+			if current is None:
+				entries[symbol] = dict(entry)
+				tokens[symbol] = _index_tokens(entry, extra)
+				return
+			current["score"] = max(current["score"], entry["score"])
+			if not current.get("alias_of") and entry.get("alias_of"):
+				current["alias_of"] = entry["alias_of"]
+			tokens[symbol] |= _index_tokens(entry, extra)
+
+		for rate in INTEREST_RATE_SUGGESTIONS:
+			entry = {k: rate[k] for k in ("symbol", "name", "exchange")}
+			entry["score"] = rate.get("priority", 320.0)
+			add(entry, (rate["symbol"][4:6], *rate.get("keywords", [])))
+		for entry in self._read_directory():
+			add(entry)
+		for entry in learned:
+			add(entry)
+		for source, target in _SUGGESTION_SYMBOL_REMAPS.items():
+			if target in tokens:
+				tokens[target].add(source.lower())
+		keys = sorted((token, symbol) for symbol, ts in tokens.items() for token in ts)
+		return entries, tokens, keys
+
+	async def maybe_reload(self) -> None:
+		now = time.time()
+		if now - self._checked < self.refresh:
+			return
+		self._checked = now
+		try:
+			mtime = os.path.getmtime(self.path)
+		except OSError:
+			return
+		if mtime == self._mtime:
+			return
+		state = await asyncio.to_thread(self._build, list(self._learned.values()))
+		self._entries, self._tokens, self._keys = state
+		self._mtime = mtime
+		# Symbols learned while the rebuild ran
+		for entry in list(self._learned.values()):
+			if entry["symbol"] not in self._entries:
+				self._insert(entry)
+		logger.info(f"Symbol directory reloaded: {len(self._entries)} symbols")
+
+	def _insert(self, entry: dict) -> None:
+		symbol = entry["symbol"]
+		self._entries[symbol] = entry
+		self._tokens[symbol] = _index_tokens(entry)
+		for token in self._tokens[symbol]:
+			bisect.insort(self._keys, (token, symbol))
+
+	def _remove(self, symbol: str) -> None:
+		self._entries.pop(symbol, None)
+		for token in self._tokens.pop(symbol, ()):
+			i = bisect.bisect_left(self._keys, (token, symbol))
+			if i < len(self._keys) and self._keys[i] == (token, symbol):
+				del self._keys[i]
+
+	# Add an upstream search result (with its _score) unless the directory already has it
+	def learn(self, item: dict) -> None:
+		symbol = (item.get("symbol") or "").upper()
+		if not symbol or self.max_learned <= 0:
+			return
+		if symbol in self._learned:
+			self._learned.move_to_end(symbol)
+			return
+		if symbol in self._entries:
+			return
+		entry = {"symbol": symbol, "name": item.get("name") or symbol, "exchange": item.get("exchange"), "score": float(item.get("_score") or 0.0)}
+		if item.get("alias_of"):
+			entry["alias_of"] = item["alias_of"]
+		self._learned[symbol] = entry
+		self._insert(entry)
+		while len(self._learned) > self.max_learned:
+			old, _ = self._learned.popitem(last=False)
+			self._remove(old)
+
+	# Best limit entries with a token starting with query; exact symbol matches first
+	def search(self, query: str, limit: int) -> List[dict]:
+		q = (query or "").strip().lower()
+		if not q or limit <= 0:
+			return []
+		keys = self._keys
+		i = bisect.bisect_left(keys, (q, ""))
+		found: set[str] = set()
+		while i < len(keys) and keys[i][0].startswith(q):
+			found.add(keys[i][1])
+			i += 1
+		entries = self._entries
+
+		def rank(symbol: str) -> tuple[bool, float]:
+			entry = entries[symbol]
+			exact = symbol.lower() == q or (entry.get("alias_of") or "").lower() == q
+			return (not exact, -entry["score"])
+
+		out: List[dict] = []
+		for symbol in heapq.nsmallest(limit, found, key=rank):
+			entry = entries[symbol]
+			item = {"symbol": symbol, "name": entry["name"], "exchange": entry.get("exchange"), "_score": entry["score"]}
+			if entry.get("alias_of"):
+				item["alias_of"] = entry["alias_of"]
+			out.append(item)
+		return out
+
+	# Whether query prefixes one of symbol's tokens; None if it is not indexed
+	def matches(self, symbol: str, query: str) -> Optional[bool]:
+		tokens = self._tokens.get(symbol)
+		if tokens is None:
+			return None
+		q = query.strip().lower()
+		return any(token.startswith(q) for token in tokens)
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+
+_symbol_index = SymbolIndex(SYMBOL_DIRECTORY_PATH, SYMBOL_DIRECTORY_REFRESH, SYMBOL_INDEX_MAX_LEARNED)
+
+
+async def _fetch_stooq_html(query: str) -> str:
 	if not query:
 		return ""
 	params = {"q": query}
 	last_text = ""
 	for _ in range(2):
-		resp = _suggestion_session.get("https://stooq.com/db/l/", params=params, timeout=6)
+		resp = await http_get("https://stooq.com/db/l/", params=params, headers=_STOOQ_HEADERS, timeout=6)
 		if resp.status_code >= 500:
-			time.sleep(0.2)
+			await asyncio.sleep(0.2)
 			continue
 		if resp.status_code >= 400:
 			raise HTTPException(status_code=502, detail=f"Stooq responded with {resp.status_code}")
@@ -344,9 +931,10 @@ def _parse_stooq_rows(raw_html: str) -> List[dict]:
 	return results
 
 
-def _fetch_yahoo_suggestions(query: str, limit: int) -> List[dict]:
+# Yahoo search matches and whether Yahoo's own result page was exhausted
+async def _fetch_yahoo_suggestions(query: str, limit: int) -> tuple[List[dict], bool]:
 	if not query:
-		return []
+		return [], True
 	params = {
 		"q": query,
 		"quotesCount": max(limit * 2, 10),
@@ -358,7 +946,7 @@ def _fetch_yahoo_suggestions(query: str, limit: int) -> List[dict]:
 		"quotesQueryId": "tss_match_phrase_query",
 		"multiQuoteQueryId": "multi_quote_single_token",
 	}
-	resp = _yahoo_suggestion_session.get("https://query2.finance.yahoo.com/v1/finance/search", params=params, timeout=6)
+	resp = await http_get("https://query2.finance.yahoo.com/v1/finance/search", params=params, headers=_YAHOO_HEADERS, timeout=6)
 	if resp.status_code >= 500:
 		raise HTTPException(status_code=502, detail="Yahoo suggest unavailable")
 	if resp.status_code >= 400:
@@ -404,10 +992,10 @@ def _fetch_yahoo_suggestions(query: str, limit: int) -> List[dict]:
 		seen.add(symbol)
 		if len(results) >= limit:
 			break
-	return results
+	return results, len(quotes) < params["quotesCount"] and len(results) < limit
 
 
-def _fetch_stooq_suggestions(query: str, limit: int) -> List[dict]:
+async def _fetch_stooq_suggestions(query: str, limit: int) -> List[dict]:
 	base = query.strip()
 	upper = base.upper()
 	terms: List[str] = []
@@ -418,17 +1006,15 @@ def _fetch_stooq_suggestions(query: str, limit: int) -> List[dict]:
 		fallback = f"{upper}.US"
 		if fallback not in terms:
 			terms.append(fallback)
+	# Term variants are looked up concurrently and merged in priority order
+	pages = await asyncio.gather(*(_fetch_stooq_html(term) for term in terms), return_exceptions=True)
 	seen = set()
 	output: List[dict] = []
-	for term in terms:
-		if not term:
-			continue
-		try:
-			html_text = _fetch_stooq_html(term)
-		except HTTPException:
-			raise
-		except Exception as exc:
-			logger.warning("Suggest fetch failed for %s: %s", term, exc)
+	for term, html_text in zip(terms, pages):
+		if isinstance(html_text, HTTPException):
+			raise html_text
+		if isinstance(html_text, BaseException):
+			logger.warning("Suggest fetch failed for %s: %s", term, html_text)
 			continue
 		for item in _parse_stooq_rows(html_text):
 			symbol = item.get("symbol")
@@ -441,29 +1027,29 @@ def _fetch_stooq_suggestions(query: str, limit: int) -> List[dict]:
 	return output
 
 
-def fetch_suggestions(query: str, limit: int) -> List[dict]:
+async def fetch_suggestions(query: str, limit: int) -> List[dict]:
+	items, _ = await collect_suggestions(query, limit)
+	return items
+
+
+# Rank Yahoo, Stooq and local-index matches into one list; None marks a source that did not answer
+def _merge_suggestions(query: str, limit: int, yahoo: Optional[tuple[List[dict], bool]], stooq: Optional[List[dict]]) -> tuple[List[dict], bool]:
 	merged: dict[str, dict] = {}
-	try:
-		yahoo_results = _fetch_yahoo_suggestions(query, limit)
-	except HTTPException:
-		raise
-	except Exception as exc:
-		logger.warning("Yahoo suggestion fetch failed for %s: %s", query, exc)
-	else:
+	complete = yahoo is not None and stooq is not None
+	if yahoo is not None:
+		yahoo_results, yahoo_complete = yahoo
+		complete = complete and yahoo_complete
 		for item in yahoo_results:
 			sym = (item.get("symbol") or "").upper()
 			if not sym:
 				continue
-			item["symbol"] = sym
-			merged[sym] = item
-	try:
-		stooq_results = _fetch_stooq_suggestions(query, limit)
-	except HTTPException:
-		raise
-	except Exception as exc:
-		logger.warning("Stooq suggestion fetch failed for %s: %s", query, exc)
-	else:
-		for item in stooq_results:
+			entry = dict(item)
+			entry["symbol"] = sym
+			merged[sym] = entry
+			_symbol_index.learn(entry)
+	if stooq is not None:
+		complete = complete and len(stooq) < limit
+		for item in stooq:
 			sym = (item.get("symbol") or "").upper()
 			if not sym or sym in merged:
 				continue
@@ -471,7 +1057,8 @@ def fetch_suggestions(query: str, limit: int) -> List[dict]:
 			entry["symbol"] = sym
 			entry["_score"] = -1.0
 			merged[sym] = entry
-	_maybe_add_interest_rate_suggestions(query, merged)
+	for item in _symbol_index.search(query, limit):
+		merged.setdefault(item["symbol"], item)
 	ordered = sorted(merged.values(), key=lambda x: x.get("_score", 0.0), reverse=True)
 	out: List[dict] = []
 	for item in ordered:
@@ -479,7 +1066,142 @@ def fetch_suggestions(query: str, limit: int) -> List[dict]:
 		out.append(item)
 		if len(out) >= limit:
 			break
-	return out
+	return out, complete and len(ordered) <= limit
+
+
+_late_suggestion_tasks: set[asyncio.Task] = set()
+
+
+async def _timed_source(name: str, lookup):
+	with span("suggest_source", name):
+		return await lookup
+
+
+# Ranked suggestions and whether they are complete; sources past the deadline finish in the background for on_late
+async def collect_suggestions(
+	query: str,
+	limit: int,
+	deadline: Optional[float] = None,
+	on_late: Optional[Callable[[List[dict], bool], None]] = None,
+) -> tuple[List[dict], bool]:
+	deadline = SUGGEST_DEADLINE if deadline is None else deadline
+	tasks = {
+		"yahoo": asyncio.ensure_future(_timed_source("yahoo", _fetch_yahoo_suggestions(query, limit))),
+		"stooq": asyncio.ensure_future(_timed_source("stooq", _fetch_stooq_suggestions(query, limit))),
+	}
+	_, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+	for name, task in tasks.items():
+		state = "late" if task in pending else "error" if task.cancelled() or task.exception() is not None else "ok"
+		_metrics.inc("suggest_upstream_total", source=name, outcome=state)
+
+	def outcome(name: str):
+		task = tasks[name]
+		if not task.done() or task.cancelled():
+			return None
+		exc = task.exception()
+		if isinstance(exc, HTTPException):
+			raise exc
+		if exc is not None:
+			logger.warning("%s suggestion fetch failed for %s: %s", name.capitalize(), query, exc)
+			return None
+		return task.result()
+
+	try:
+		result = _merge_suggestions(query, limit, outcome("yahoo"), outcome("stooq"))
+	except HTTPException:
+		for task in pending:
+			task.cancel()
+		raise
+	if pending:
+		logger.info(f"/suggest: {', '.join(n for n, t in tasks.items() if t in pending)} missed the {deadline}s deadline for '{query}'")
+		if on_late is None:
+			for task in pending:
+				task.cancel()
+		else:
+			async def finish_late() -> None:
+				await asyncio.wait(pending)
+				try:
+					items, complete = _merge_suggestions(query, limit, outcome("yahoo"), outcome("stooq"))
+				except HTTPException:
+					return
+				on_late(items, complete)
+
+			late = asyncio.ensure_future(finish_late())
+			_late_suggestion_tasks.add(late)
+			late.add_done_callback(_late_suggestion_tasks.discard)
+	return result
+
+
+# True when item still matches query via the symbol index or as a substring of its symbol, name or alias
+def _suggestion_matches(item: dict, query: str) -> bool:
+	if _symbol_index.matches(item.get("symbol") or "", query):
+		return True
+	return any(query in (item.get(k) or "").lower() for k in ("symbol", "name", "alias_of"))
+
+
+# LRU of /suggest results per lower-cased query with TTL; complete entries also answer longer queries by filtering
+class SuggestionCache:
+	def __init__(self, max_entries: int, ttl: float):
+		self.max_entries = max_entries
+		self.ttl = ttl
+		self._entries: OrderedDict[str, tuple[float, List[dict], bool]] = OrderedDict()
+		self.hits = 0
+		self.prefix_hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.expirations = 0
+
+	def _fresh(self, key: str, now: float) -> Optional[tuple[float, List[dict], bool]]:
+		entry = self._entries.get(key)
+		if entry is None:
+			return None
+		if now - entry[0] >= self.ttl:
+			del self._entries[key]
+			self.expirations += 1
+			return None
+		self._entries.move_to_end(key)
+		return entry
+
+	def get(self, query: str, limit: int, now: Optional[float] = None) -> Optional[List[dict]]:
+		now = time.time() if now is None else now
+		key = query.strip().lower()
+		entry = self._fresh(key, now)
+		if entry is not None and (entry[2] or len(entry[1]) >= limit):
+			self.hits += 1
+			return entry[1][:limit]
+		for cut in range(len(key) - 1, 0, -1):
+			base = self._fresh(key[:cut], now)
+			if base is None or not base[2]:
+				continue
+			items = [item for item in base[1] if _suggestion_matches(item, key)]
+			self.put(key, items, True, now=base[0])
+			self.prefix_hits += 1
+			return items[:limit]
+		self.misses += 1
+		return None
+
+	def put(self, query: str, items: List[dict], complete: bool, now: Optional[float] = None) -> None:
+		key = query.strip().lower()
+		self._entries[key] = (time.time() if now is None else now, items, complete)
+		self._entries.move_to_end(key)
+		while len(self._entries) > self.max_entries:
+			self._entries.popitem(last=False)
+			self.evictions += 1
+
+	def stats(self) -> dict:
+		return {
+			"entries": len(self._entries),
+			"max_entries": self.max_entries,
+			"ttl": self.ttl,
+			"hits": self.hits,
+			"prefix_hits": self.prefix_hits,
+			"misses": self.misses,
+			"evictions": self.evictions,
+			"expirations": self.expirations,
+		}
+
+
+_suggestion_cache = SuggestionCache(SUGGESTION_CACHE_SIZE, SUGGESTION_CACHE_TTL)
 
 
 @app.get("/")
@@ -493,360 +1215,2013 @@ def root():
 	}
 
 
-@app.get("/history")
-def get_history(ticker: str, start: str, end: str):
+# Normalize some common aliases (US rates, gold) to provider symbols
+_TICKER_ALIASES = {
+	# Common typo for Stooq US interest rate index
+	"intrus.m": "INRTUS.M",
+	"us10y": "^TNX",  # 10Y Treasury yield index (approx x10)
+	"10y": "^TNX",
+	"^tnx": "^TNX",
+	"us30y": "^TYX",  # 30Y Treasury yield index (approx x10)
+	"30y": "^TYX",
+	"^tyx": "^TYX",
+	"gold": "XAUUSD=X",  # Gold spot in USD
+	"xau": "XAUUSD=X",
+	"xauusd": "XAUUSD=X",
+	"xauusd=x": "XAUUSD=X",
+	"gc=f": "GC=F",  # Gold futures continuous
+}
+
+
+def normalize_ticker(sym: str) -> str:
+	if not sym:
+		return sym
+	return _TICKER_ALIASES.get(sym.strip().lower(), sym)
+
+
+def build_symbol_variants(user_sym: str, normalized_sym: str) -> List[str]:
+	key_user = (user_sym or "").strip().lower()
+	key_norm = (normalized_sym or "").strip().lower()
+	variants = []
+	# Always try the normalized symbol first
+	if normalized_sym:
+		variants.append(normalized_sym)
+	# Gold variants
+	if key_user in {"gold", "xau", "xauusd"} or key_norm in {"xauusd=x", "gc=f", "xauusd"}:
+		# Yahoo spot & futures, ETF, and Stooq spot symbol
+		for v in ["XAUUSD=X", "GC=F", "GLD", "XAUUSD"]:
+			if v not in variants:
+				variants.append(v)
+	# US rates variants (use ETFs as fallbacks when indices blocked)
+	if key_user in {"us10y", "10y"} or key_norm == "^tnx":
+		# Yahoo index, ETF proxy, and Stooq interest rate index
+		for v in ["^TNX", "IEF", "INRTUS.M"]:
+			if v not in variants:
+				variants.append(v)
+	if key_user in {"us30y", "30y"} or key_norm == "^tyx":
+		for v in ["^TYX", "TLT"]:
+			if v not in variants:
+				variants.append(v)
+	# Ensure original user symbol is also tried if distinct
+	if user_sym and user_sym not in variants:
+		variants.append(user_sym)
+	return variants
+
+
+# Normalize incoming dates to YYYY-MM-DD accepting various formats
+def normalize_date(s: str) -> str:
+	if not s:
+		return s
+	# If already ISO date, return as-is to avoid pandas warnings
+	if isinstance(s, str) and len(s) == 10 and s[4] == '-' and s[7] == '-' and s[:4].isdigit() and s[5:7].isdigit() and s[8:10].isdigit():
+		return s
+	# Try dayfirst, then monthfirst
+	for dayfirst in (True, False):
+		try:
+			dt = pd.to_datetime(s, dayfirst=dayfirst, errors="raise")
+			return dt.strftime("%Y-%m-%d")
+		except Exception:
+			continue
+	# Fallback: return original; yfinance may still handle
+	return s
+
+
+def normalize_ohlcv_df(df: pd.DataFrame) -> pd.DataFrame:
+	if df is None or df.empty:
+		return pd.DataFrame()
+	df = df.reset_index()
+	if isinstance(df.columns, pd.MultiIndex):
+		df.columns = [c[0] if isinstance(c, tuple) else c for c in df.columns]
+	# Find datetime column and name it 'date'
+	dt_col_name = None
+	if len(df.columns) > 0:
+		for col in df.columns:
+			series = df[col]
+			# Guard against empty series access
+			is_dt = pd.api.types.is_datetime64_any_dtype(series)
+			if not is_dt and len(series) > 0:
+				is_dt = isinstance(series.iloc[0], (pd.Timestamp, datetime))
+			if is_dt:
+				dt_col_name = col
+				break
+	if dt_col_name is not None and str(dt_col_name).lower() != "date":
+		df = df.rename(columns={dt_col_name: "date"})
+	# Lowercase normalize
+	df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+	# Standardize common variants
+	rename_map = {
+		"adj_close": "adjclose",
+		"adjclose": "adj_close",
+	}
+	df = df.rename(columns=rename_map)
+	return df
+
+
+# Rows with s <= date <= e; sorted naive datetimes are sliced by binary search
+def _slice_dates(df: pd.DataFrame, s: pd.Timestamp, e: pd.Timestamp) -> pd.DataFrame:
+	dates = df["date"]
+	if isinstance(dates.dtype, np.dtype) and dates.dtype.kind == "M" and dates.is_monotonic_increasing:
+		values = dates.to_numpy()
+		lo = int(np.searchsorted(values, s.to_datetime64(), side="left"))
+		hi = int(np.searchsorted(values, e.to_datetime64(), side="right"))
+		return df.iloc[lo:hi]
+	return df[(dates >= s) & (dates <= e)]
+
+
+def filter_date_range(df: pd.DataFrame, start_s: str, end_s: str) -> pd.DataFrame:
+	if df.empty:
+		return df
 	try:
-		# Normalize some common aliases (US rates, gold) to provider symbols
-		def normalize_ticker(sym: str) -> str:
-			if not sym:
-				return sym
-			key = sym.strip().lower()
-			aliases = {
-				# Common typo for Stooq US interest rate index
-				"intrus.m": "INRTUS.M",
-				"us10y": "^TNX",  # 10Y Treasury yield index (approx x10)
-				"10y": "^TNX",
-				"^tnx": "^TNX",
-				"us30y": "^TYX",  # 30Y Treasury yield index (approx x10)
-				"30y": "^TYX",
-				"^tyx": "^TYX",
-				"gold": "XAUUSD=X",  # Gold spot in USD
-				"xau": "XAUUSD=X",
-				"xauusd": "XAUUSD=X",
-				"xauusd=x": "XAUUSD=X",
-				"gc=f": "GC=F",  # Gold futures continuous
-			}
-			return aliases.get(key, sym)
-
-		orig_ticker = ticker
-		ticker = normalize_ticker(ticker)
-
-		def build_symbol_variants(user_sym: str, normalized_sym: str) -> list[str]:
-			key_user = (user_sym or "").strip().lower()
-			key_norm = (normalized_sym or "").strip().lower()
-			variants = []
-			# Always try the normalized symbol first
-			if normalized_sym:
-				variants.append(normalized_sym)
-			# Gold variants
-			if key_user in {"gold", "xau", "xauusd"} or key_norm in {"xauusd=x", "gc=f", "xauusd"}:
-				# Yahoo spot & futures, ETF, and Stooq spot symbol
-				for v in ["XAUUSD=X", "GC=F", "GLD", "XAUUSD"]:
-					if v not in variants:
-						variants.append(v)
-			# US rates variants (use ETFs as fallbacks when indices blocked)
-			if key_user in {"us10y", "10y"} or key_norm == "^tnx":
-				# Yahoo index, ETF proxy, and Stooq interest rate index
-				for v in ["^TNX", "IEF", "INRTUS.M"]:
-					if v not in variants:
-						variants.append(v)
-			if key_user in {"us30y", "30y"} or key_norm == "^tyx":
-				for v in ["^TYX", "TLT"]:
-					if v not in variants:
-						variants.append(v)
-			# Ensure original user symbol is also tried if distinct
-			if user_sym and user_sym not in variants:
-				variants.append(user_sym)
-			return variants
-
-		symbol_variants = build_symbol_variants(orig_ticker, ticker)
-		# Normalize incoming dates to YYYY-MM-DD accepting various formats
-		def normalize_date(s: str) -> str:
-			if not s:
-				return s
-			# If already ISO date, return as-is to avoid pandas warnings
-			if isinstance(s, str) and len(s) == 10 and s[4] == '-' and s[7] == '-' and s[:4].isdigit() and s[5:7].isdigit() and s[8:10].isdigit():
-				return s
-			# Try dayfirst, then monthfirst
-			for dayfirst in (True, False):
-				try:
-					dt = pd.to_datetime(s, dayfirst=dayfirst, errors="raise")
-					return dt.strftime("%Y-%m-%d")
-				except Exception:
-					continue
-			# Fallback: return original; yfinance may still handle
-			return s
-
-		start = normalize_date(start)
-		end = normalize_date(end)
-
-		# Helpers
-		def normalize_ohlcv_df(df: pd.DataFrame) -> pd.DataFrame:
-			if df is None or df.empty:
-				return pd.DataFrame()
-			df = df.reset_index()
-			if isinstance(df.columns, pd.MultiIndex):
-				df.columns = [c[0] if isinstance(c, tuple) else c for c in df.columns]
-			# Find datetime column and name it 'date'
-			dt_col_name = None
-			if len(df.columns) > 0:
-				for col in df.columns:
-					series = df[col]
-					# Guard against empty series access
-					is_dt = pd.api.types.is_datetime64_any_dtype(series)
-					if not is_dt and len(series) > 0:
-						is_dt = isinstance(series.iloc[0], (pd.Timestamp, datetime))
-					if is_dt:
-						dt_col_name = col
-						break
-			if dt_col_name is not None and str(dt_col_name).lower() != "date":
-				df = df.rename(columns={dt_col_name: "date"})
-			# Lowercase normalize
-			df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
-			# Standardize common variants
-			rename_map = {
-				"adj_close": "adjclose",
-				"adjclose": "adj_close",
+		s = pd.to_datetime(start_s)
+		e = pd.to_datetime(end_s)
+		if "date" in df.columns and pd.api.types.is_datetime64_any_dtype(df["date"]):
+			# Already parsed (e.g. at read_csv time): only the range filter is left
+			return _slice_dates(df, s, e)
+		if "date" in df.columns:
+			# Prefer explicit YYYY-MM-DD parsing when the strings match ISO format to avoid warnings
+			def _parse_dates(col: pd.Series) -> pd.Series:
+				obj = col.astype("string").replace({pd.NA: None, "NaT": None, "nat": None, "nan": None})
+				sample = obj.dropna().head(12)
+
+				def try_format(fmt: str) -> Optional[pd.Series]:
+					try:
+						parsed = pd.to_datetime(obj, format=fmt, errors="coerce")
+						if sample.empty or parsed.loc[sample.index].notna().all():
+							return parsed
+					except Exception:
+						return None
+					return None
+
+				# Try common formats explicitly to avoid pandas format inference warnings.
+				for fmt, pattern in [
+					("%Y-%m-%d", r"^\d{4}-\d{2}-\d{2}$"),
+					("%Y-%m-%d %H:%M:%S", r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$"),
+					("%Y/%m/%d", r"^\d{4}/\d{2}/\d{2}$"),
+					("%m/%d/%Y", r"^\d{2}/\d{2}/\d{4}$"),
+					("%d/%m/%Y", r"^\d{2}/\d{2}/\d{4}$"),
+				]:
+					if sample.empty:
+						parsed = try_format(fmt)
+						if parsed is not None:
+							return parsed
+					else:
+						if sample.str.fullmatch(pattern).all():
+							parsed = try_format(fmt)
+							if parsed is not None:
+								return parsed
+
+				# Fallback: parse item-by-item to avoid global inference warnings.
+				def parse_scalar(val: Optional[str]):
+					if val is None:
+						return pd.NaT
+					text = val.strip()
+					if not text or text.lower() in {"nat", "nan"}:
+						return pd.NaT
+					for fmt in ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d", "%m/%d/%Y", "%d/%m/%Y"):
+						try:
+							return datetime.strptime(text, fmt)
+						except ValueError:
+							continue
+					try:
+						return pd.Timestamp(text)
+					except Exception:
+						return pd.NaT
+
+				parsed_list = [parse_scalar(v) for v in obj]
+				return pd.Series(parsed_list, index=col.index, dtype="datetime64[ns]")
+			df["date"] = _parse_dates(df["date"])  # type: ignore
+			df = _slice_dates(df, s, e)
+		return df
+	except Exception:
+		return df
+
+
+# Short-lived LRU of (provider, symbol) date spans that came back empty
+class NegativeCache:
+	def __init__(self, ttl: float, max_entries: int):
+		self.ttl = ttl
+		self.max_entries = max_entries
+		self._entries: OrderedDict[tuple[str, str], tuple[float, str, str]] = OrderedDict()
+		self.skipped = 0
+
+	def remember(self, provider: str, symbol: str, start: str, end: str) -> None:
+		if self.ttl <= 0:
+			return
+		key = (provider, symbol)
+		now = time.time()
+		entry = self._entries.get(key)
+		if entry is not None and entry[0] > now and start <= entry[2] and end >= entry[1]:
+			start, end = min(start, entry[1]), max(end, entry[2])
+		self._entries[key] = (now + self.ttl, start, end)
+		self._entries.move_to_end(key)
+		while len(self._entries) > self.max_entries:
+			self._entries.popitem(last=False)
+
+	def known_empty(self, provider: str, symbol: str, start: str, end: str) -> bool:
+		entry = self._entries.get((provider, symbol))
+		if entry is None:
+			return False
+		if entry[0] <= time.time():
+			del self._entries[(provider, symbol)]
+			return False
+		if entry[1] <= start and end <= entry[2]:
+			self.skipped += 1
+			return True
+		return False
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+
+# Per-provider circuit breaker: after PROVIDER_BREAKER_FAILURES failures in a row the provider goes last for the cooldown
+class ProviderHealth:
+	def __init__(self, failures: int, cooldown: float):
+		self.failures = failures
+		self.cooldown = cooldown
+		self._state: dict[str, dict] = {}
+
+	def record(self, provider: str, ok: bool, latency: Optional[float] = None) -> None:
+		st = self._state.setdefault(provider, {"failures": 0, "open_until": 0.0, "latency": None, "successes": 0, "errors": 0})
+		if latency is not None:
+			st["latency"] = latency if st["latency"] is None else 0.8 * st["latency"] + 0.2 * latency
+		if ok:
+			if st["open_until"]:
+				logger.info(f"Provider {provider} recovered")
+			st["failures"] = 0
+			st["open_until"] = 0.0
+			st["successes"] += 1
+			return
+		st["failures"] += 1
+		st["errors"] += 1
+		if st["failures"] >= self.failures:
+			if not self.is_open(provider):
+				logger.warning(f"Provider {provider} failing ({st['failures']} in a row); deprioritizing for {self.cooldown:.0f}s")
+			st["open_until"] = time.time() + self.cooldown
+
+	def is_open(self, provider: str) -> bool:
+		st = self._state.get(provider)
+		return st is not None and time.time() < st["open_until"]
+
+	# providers with the ones whose breaker is open moved to the end
+	def order(self, providers: List[str]) -> List[str]:
+		return sorted(providers, key=self.is_open)
+
+	def stats(self) -> dict:
+		return {
+			p: {
+				"open": self.is_open(p),
+				"consecutive_failures": st["failures"],
+				"successes": st["successes"],
+				"errors": st["errors"],
+				"latency_ms": None if st["latency"] is None else round(st["latency"] * 1000.0, 1),
 			}
-			df = df.rename(columns=rename_map)
-			return df
+			for p, st in self._state.items()
+		}
 
-		def filter_date_range(df: pd.DataFrame, start_s: str, end_s: str) -> pd.DataFrame:
-			if df.empty:
-				return df
-			try:
-				s = pd.to_datetime(start_s)
-				e = pd.to_datetime(end_s)
-				if "date" in df.columns:
-					# Prefer explicit YYYY-MM-DD parsing when the strings match ISO format to avoid warnings
-					def _parse_dates(col: pd.Series) -> pd.Series:
-						obj = col.astype("string").replace({pd.NA: None, "NaT": None, "nat": None, "nan": None})
-						sample = obj.dropna().head(12)
-				
-						def try_format(fmt: str) -> Optional[pd.Series]:
-							try:
-								parsed = pd.to_datetime(obj, format=fmt, errors="coerce")
-								if sample.empty or parsed.loc[sample.index].notna().all():
-									return parsed
-							except Exception:
-								return None
-							return None
-
-						# Try common formats explicitly to avoid pandas format inference warnings.
-						for fmt, pattern in [
-							("%Y-%m-%d", r"^\d{4}-\d{2}-\d{2}$"),
-							("%Y-%m-%d %H:%M:%S", r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$"),
-							("%Y/%m/%d", r"^\d{4}/\d{2}/\d{2}$"),
-							("%m/%d/%Y", r"^\d{2}/\d{2}/\d{4}$"),
-							("%d/%m/%Y", r"^\d{2}/\d{2}/\d{4}$"),
-						]:
-							if sample.empty:
-								parsed = try_format(fmt)
-								if parsed is not None:
-									return parsed
-							else:
-								if sample.str.fullmatch(pattern).all():
-									parsed = try_format(fmt)
-									if parsed is not None:
-										return parsed
-
-						# Fallback: parse item-by-item to avoid global inference warnings.
-						def parse_scalar(val: Optional[str]):
-							if val is None:
-								return pd.NaT
-							text = val.strip()
-							if not text or text.lower() in {"nat", "nan"}:
-								return pd.NaT
-							for fmt in ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d", "%m/%d/%Y", "%d/%m/%Y"):
-								try:
-									return datetime.strptime(text, fmt)
-								except ValueError:
-									continue
-							try:
-								return pd.Timestamp(text)
-							except Exception:
-								return pd.NaT
-
-						parsed_list = [parse_scalar(v) for v in obj]
-						return pd.Series(parsed_list, index=col.index, dtype="datetime64[ns]")
-					df["date"] = _parse_dates(df["date"])  # type: ignore
-					df = df[(df["date"] >= s) & (df["date"] <= e)]
-				return df
-			except Exception:
-				return df
 
-		def fetch_yahoo(symbol: str, s: str, e: str) -> pd.DataFrame:
+_negative_history = NegativeCache(HISTORY_NEGATIVE_TTL, HISTORY_NEGATIVE_MAX)
+_provider_health = ProviderHealth(PROVIDER_BREAKER_FAILURES, PROVIDER_BREAKER_COOLDOWN)
+_UNHEALTHY_STATUSES = {401, 403, 429} | _RETRY_STATUSES
+
+
+def _parse_yahoo_chart(payload: dict) -> pd.DataFrame:
+	results = ((payload or {}).get("chart") or {}).get("result") or []
+	if not results:
+		return pd.DataFrame()
+	res = results[0] or {}
+	stamps = res.get("timestamp") or []
+	if not stamps:
+		return pd.DataFrame()
+	quote = ((res.get("indicators") or {}).get("quote") or [{}])[0] or {}
+	# Daily bars are stamped at the session open; shift by the exchange offset to get the local trading date
+	offset = int((res.get("meta") or {}).get("gmtoffset") or 0)
+	data = {"date": pd.to_datetime(pd.Series(stamps, dtype="int64") + offset, unit="s").dt.normalize()}
+	for col in _BAR_COLUMNS:
+		values = quote.get(col) or [None] * len(stamps)
+		data[col] = pd.to_numeric(pd.Series(values, dtype="object"), errors="coerce").astype("float64")
+	return pd.DataFrame(data)
+
+
+async def fetch_yahoo(symbol: str, s: str, e: str) -> pd.DataFrame:
+	if _negative_history.known_empty("yahoo", symbol, s, e):
+		_metrics.inc("history_provider_attempts_total", provider="yahoo", outcome="skipped")
+		return pd.DataFrame()
+	started = time.perf_counter()
+	try:
+		logger.info(f"/history: fetching from Yahoo for {symbol} {s}→{e}")
+		period1 = int(pd.Timestamp(s, tz="UTC").timestamp())
+		# period2 is exclusive; push it one day out so the range is inclusive like Stooq's
+		period2 = int((pd.Timestamp(e, tz="UTC") + pd.Timedelta(days=1)).timestamp())
+		with span("fetch", "yahoo"):
+			resp = await http_get(
+				f"https://query2.finance.yahoo.com/v8/finance/chart/{quote_url(symbol, safe='')}",
+				params={"period1": period1, "period2": period2, "interval": "1d", "events": "div,splits"},
+				headers=_YAHOO_HEADERS,
+				backoff=0.5,
+			)
+		_provider_health.record("yahoo", resp.status_code not in _UNHEALTHY_STATUSES, time.perf_counter() - started)
+		if resp.status_code != 200:
+			logger.warning(f"Yahoo HTTP {resp.status_code} for {symbol}")
+			_metrics.inc("history_provider_attempts_total", provider="yahoo", outcome="http_error")
+			if resp.status_code == 404:
+				_negative_history.remember("yahoo", symbol, s, e)
+			return pd.DataFrame()
+		with span("parse", "yahoo"):
+			df = await asyncio.to_thread(_parse_yahoo_chart, resp.json())
+			df = filter_date_range(df, s, e)
+		_metrics.inc("history_provider_attempts_total", provider="yahoo", outcome="empty" if df.empty else "data")
+		if df.empty:
+			_negative_history.remember("yahoo", symbol, s, e)
+		return df
+	except Exception as ex:
+		logger.warning(f"Yahoo fetch failed for {symbol}: {ex}")
+		_metrics.inc("history_provider_attempts_total", provider="yahoo", outcome="error")
+		_provider_health.record("yahoo", False)
+		return pd.DataFrame()
+
+
+_STOOQ_COLUMNS = ["date", "open", "high", "low", "close", "volume"]
+_ISO_DAY_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def _parse_stooq_csv(text: str, s: str, e: str) -> pd.DataFrame:
+	# Fast path: Stooq's usual "Date,Open,High,Low,Close[,Volume]" with ISO dates is
+	# parsed in one read_csv call with a fixed date format, no inference or re-parsing.
+	header, _, rest = text.partition("\n")
+	first_cell = header.split(",", 1)[0].strip().lower()
+	if first_cell in {"date", "data"} and _ISO_DAY_RE.match(rest):
+		ncols = min(header.count(",") + 1, len(_STOOQ_COLUMNS))
+		if ncols >= 5:
 			try:
-				logger.info(f"/history: fetching from Yahoo for {symbol} {s}→{e}")
-				# Use a session with retries and a browser UA to avoid simple bot blocks
-				session = requests.Session()
-				session.headers.update({
-					"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
-					"Accept": "*/*",
-					"Accept-Encoding": "gzip, deflate, br",
-					"Connection": "keep-alive",
-				})
-				retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
-				session.mount("https://", HTTPAdapter(max_retries=retry))
-				df = yf.download(
-					symbol,
-					start=s,
-					end=e,
-					progress=False,
-					auto_adjust=False,
-					group_by="column",
-					threads=False,
-					session=session,
+				df = pd.read_csv(
+					StringIO(text),
+					header=0,
+					names=_STOOQ_COLUMNS[:ncols],
+					usecols=range(ncols),
+					parse_dates=["date"],
+					date_format="%Y-%m-%d",
 				)
-				df = normalize_ohlcv_df(df)
+			except (ValueError, pd.errors.ParserError):
+				df = None
+			if df is not None and pd.api.types.is_datetime64_any_dtype(df["date"]):
+				return filter_date_range(df, s, e)
+	# Read CSV from text
+	df = pd.read_csv(StringIO(text), header=None)
+	# Stooq daily CSV is usually: Date,Open,High,Low,Close,Volume
+	if df.shape[1] >= 5:
+		cols = ["date", "open", "high", "low", "close"] + (["volume"] if df.shape[1] >= 6 else [])
+		df.columns = cols + [f"extra{i}" for i in range(df.shape[1]-len(cols))]
+		# Drop any extra columns beyond volume
+		df = df[cols]
+	else:
+		# Try default parser if shape unexpected
+		df = pd.read_csv(StringIO(text))
+	# Normalize columns and date range
+	df.columns = [str(c).strip().lower() for c in df.columns]
+	if "date" not in df.columns and "data" in df.columns:
+		df = df.rename(columns={"data": "date"})
+	df = normalize_ohlcv_df(df)
+	return filter_date_range(df, s, e)
+
+
+async def fetch_stooq(symbol: str, s: str, e: str) -> pd.DataFrame:
+	# Try multiple symbol variants for Stooq (common: '.us' for US tickers)
+	candidates = []
+	base = symbol.lower()
+	candidates.append(base)
+	if not base.endswith('.us'):
+		candidates.append(base + '.us')
+	for cand in candidates:
+		if _negative_history.known_empty("stooq", cand, s, e):
+			_metrics.inc("history_provider_attempts_total", provider="stooq", outcome="skipped")
+			continue
+		started = time.perf_counter()
+		try:
+			# d1/d2 bound the CSV to the requested window instead of the full history
+			d1 = pd.Timestamp(s).strftime("%Y%m%d")
+			d2 = pd.Timestamp(e).strftime("%Y%m%d")
+			url = f"https://stooq.com/q/d/l/?s={cand}&i=d&d1={d1}&d2={d2}"
+			logger.info(f"/history: fetching from Stooq for {symbol} via {url}")
+			with span("fetch", "stooq"):
+				resp = await http_get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=10)
+			_provider_health.record("stooq", resp.status_code not in _UNHEALTHY_STATUSES, time.perf_counter() - started)
+			if resp.status_code != 200:
+				logger.warning(f"Stooq HTTP {resp.status_code} for {symbol} ({cand})")
+				_metrics.inc("history_provider_attempts_total", provider="stooq", outcome="http_error")
+				continue
+			text = resp.text.strip()
+			if not text or text.lower().startswith("no data"):
+				_metrics.inc("history_provider_attempts_total", provider="stooq", outcome="empty")
+				_negative_history.remember("stooq", cand, s, e)
+				continue
+			# Parsing decades of CSV is CPU work; keep it off the event loop
+			with span("parse", "stooq"):
+				df = await asyncio.to_thread(_parse_stooq_csv, text, s, e)
+			if df is not None and not df.empty:
+				_metrics.inc("history_provider_attempts_total", provider="stooq", outcome="data")
 				return df
-			except Exception as ex:
-				logger.warning(f"Yahoo fetch failed for {symbol}: {ex}")
-				return pd.DataFrame()
-
-		def fetch_stooq(symbol: str, s: str, e: str) -> pd.DataFrame:
-			# Try multiple symbol variants for Stooq (common: '.us' for US tickers)
-			candidates = []
-			base = symbol.lower()
-			candidates.append(base)
-			if not base.endswith('.us'):
-				candidates.append(base + '.us')
-			for cand in candidates:
-				try:
-					url = f"https://stooq.com/q/d/l/?s={cand}&i=d"
-					logger.info(f"/history: fetching from Stooq for {symbol} via {url}")
-					resp = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=10)
-					if resp.status_code != 200:
-						logger.warning(f"Stooq HTTP {resp.status_code} for {symbol} ({cand})")
-						continue
-					text = resp.text.strip()
-					if not text or text.lower().startswith("no data"):
-						continue
-					# Read CSV from text
-					from io import StringIO
-					df = pd.read_csv(StringIO(text), header=None)
-					# Stooq daily CSV is usually: Date,Open,High,Low,Close,Volume
-					if df.shape[1] >= 5:
-						cols = ["date", "open", "high", "low", "close"] + (["volume"] if df.shape[1] >= 6 else [])
-						df.columns = cols + [f"extra{i}" for i in range(df.shape[1]-len(cols))]
-						# Drop any extra columns beyond volume
-						df = df[cols]
-					else:
-						# Try default parser if shape unexpected
-						df = pd.read_csv(StringIO(text))
-					# Normalize columns and date range
-					df.columns = [str(c).strip().lower() for c in df.columns]
-					if "date" not in df.columns and "data" in df.columns:
-						df = df.rename(columns={"data": "date"})
-					df = normalize_ohlcv_df(df)
-					df = filter_date_range(df, s, e)
-					if df is not None and not df.empty:
-						return df
-				except Exception as ex:
-					logger.warning(f"Stooq fetch failed for {symbol} ({cand}): {ex}")
-					continue
-			return pd.DataFrame()
+			_metrics.inc("history_provider_attempts_total", provider="stooq", outcome="empty")
+			_negative_history.remember("stooq", cand, s, e)
+		except Exception as ex:
+			logger.warning(f"Stooq fetch failed for {symbol} ({cand}): {ex}")
+			_metrics.inc("history_provider_attempts_total", provider="stooq", outcome="error")
+			_provider_health.record("stooq", False)
+			continue
+	return pd.DataFrame()
+
+
+HISTORY_FETCHERS = {
+	"yahoo": fetch_yahoo,
+	"stooq": fetch_stooq,
+}
 
-		# Decide provider order (prefer Stooq by default to avoid Yahoo blocks on some hosts)
-		providers_env = os.getenv("PROVIDERS", "stooq,yahoo")
-		providers = [p.strip().lower() for p in providers_env.split(",") if p.strip()]
-		# If the normalized ticker requires Yahoo (e.g., '^' indices or FX '=')
-		# then prefer Yahoo first for this request regardless of default order
-		if ticker and (ticker.startswith('^') or '=' in ticker):
-			providers = ["yahoo"] + [p for p in providers if p != "yahoo"]
-		if not providers:
-			providers = ["yahoo", "stooq"]
-
-		df = pd.DataFrame()
-		used_symbol: Optional[str] = None
-		errors: List[str] = []
-		for p in providers:
-			found_for_provider = False
-			for sym in symbol_variants:
-				if p == "yahoo":
-					df = fetch_yahoo(sym, start, end)
-				elif p == "stooq":
-					df = fetch_stooq(sym, start, end)
-				else:
-					logger.warning(f"Unknown provider '{p}' ignored")
-					continue
-				if df is not None and not df.empty:
-					used_provider = p
-					used_symbol = sym
-					found_for_provider = True
-					break
-			if found_for_provider:
+_BAR_COLUMNS = ["open", "high", "low", "close", "volume"]
+_EPOCH_DAY = np.datetime64("1970-01-01", "D")
+
+
+def _day_number(day: str) -> int:
+	return int((np.datetime64(day, "D") - _EPOCH_DAY).astype(np.int64))
+
+
+# Read-only daily bars (int32 days, float64 OHLCV); slices are views, so cached series are shared without copies
+class BarSeries:
+	__slots__ = ("days", "open", "high", "low", "close", "volume")
+
+	def __init__(self, days: np.ndarray, open: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray):
+		self.days = days
+		self.open = open
+		self.high = high
+		self.low = low
+		self.close = close
+		self.volume = volume
+		for arr in (days, open, high, low, close, volume):
+			arr.flags.writeable = False
+
+	@classmethod
+	def blank(cls) -> "BarSeries":
+		return cls(np.empty(0, np.int32), *(np.empty(0, np.float64) for _ in _BAR_COLUMNS))
+
+	# Build from day numbers and an N×5 OHLCV matrix, dropping incomplete rows and keeping the last duplicate day
+	@classmethod
+	def from_arrays(cls, days: np.ndarray, fields: np.ndarray) -> "BarSeries":
+		keep = np.isfinite(fields[:, :4]).all(axis=1)
+		days, fields = days[keep], fields[keep]
+		if len(days) > 1 and not (np.diff(days) > 0).all():
+			order = np.argsort(days, kind="stable")
+			days, fields = days[order], fields[order]
+			last = np.append(days[1:] != days[:-1], True)
+			days, fields = days[last], fields[last]
+		cols = np.ascontiguousarray(fields.T, dtype=np.float64)
+		return cls(days.astype(np.int32), *cols)
+
+	@classmethod
+	def from_frame(cls, df: Optional[pd.DataFrame]) -> "BarSeries":
+		if df is None or df.empty or "date" not in df.columns:
+			return cls.blank()
+		dates = df["date"]
+		if not pd.api.types.is_datetime64_any_dtype(dates):
+			dates = pd.to_datetime(dates, errors="coerce")
+		if getattr(dates.dt, "tz", None) is not None:
+			dates = dates.dt.tz_localize(None)
+		day = dates.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+		fields = np.column_stack([
+			pd.to_numeric(df[c], errors="coerce").to_numpy(dtype="float64") if c in df.columns else np.full(len(df), np.nan)
+			for c in _BAR_COLUMNS
+		])
+		valid = ~np.isnat(day)
+		return cls.from_arrays((day[valid] - _EPOCH_DAY).astype(np.int64), fields[valid])
+
+	def __len__(self) -> int:
+		return len(self.days)
+
+	@property
+	def empty(self) -> bool:
+		return len(self.days) == 0
+
+	@property
+	def nbytes(self) -> int:
+		return sum(arr.nbytes for arr in (self.days, self.open, self.high, self.low, self.close, self.volume))
+
+	# Bars in [start, end] (YYYY-MM-DD) as views into this series
+	def slice(self, start: str, end: str) -> "BarSeries":
+		# int32 probes keep searchsorted from upcasting (copying) the day array
+		lo = int(np.searchsorted(self.days, np.int32(_day_number(start)), side="left"))
+		hi = int(np.searchsorted(self.days, np.int32(_day_number(end)), side="right"))
+		return BarSeries(self.days[lo:hi], self.open[lo:hi], self.high[lo:hi], self.low[lo:hi], self.close[lo:hi], self.volume[lo:hi])
+
+	# Rows lo..hi-1 as views into this series
+	def rows(self, lo: int, hi: int) -> "BarSeries":
+		return BarSeries(self.days[lo:hi], self.open[lo:hi], self.high[lo:hi], self.low[lo:hi], self.close[lo:hi], self.volume[lo:hi])
+
+	def field(self, name: str) -> np.ndarray:
+		return getattr(self, name) if name in _BAR_COLUMNS else np.full(len(self.days), np.nan)
+
+	def dates(self) -> np.ndarray:
+		return self.days.astype("datetime64[D]")
+
+	def index(self) -> pd.DatetimeIndex:
+		return pd.DatetimeIndex(self.days.astype("datetime64[D]").astype("datetime64[ns]"))
+
+	def to_frame(self) -> pd.DataFrame:
+		frame = pd.DataFrame({c: getattr(self, c) for c in _BAR_COLUMNS})
+		frame.insert(0, "date", self.index())
+		return frame
+
+
+# Byte-bounded LRU of full BarSeries; versions keep a read that raced a write from being stored
+class SeriesCache:
+	def __init__(self, max_bytes: int):
+		self.max_bytes = max_bytes
+		self.bytes = 0
+		self._entries: OrderedDict[tuple[str, str], tuple[BarSeries, object]] = OrderedDict()
+		self._versions: dict[tuple[str, str], int] = {}
+
+	def get(self, key: tuple[str, str], tag: object = None) -> Optional[BarSeries]:
+		entry = self._entries.get(key)
+		if entry is None or entry[1] != tag:
+			return None
+		self._entries.move_to_end(key)
+		return entry[0]
+
+	def version(self, key: tuple[str, str]) -> int:
+		return self._versions.get(key, 0)
+
+	def put(self, key: tuple[str, str], bars: BarSeries, version: int, tag: object = None) -> None:
+		if version != self.version(key) or bars.nbytes > self.max_bytes:
+			return
+		self.discard(key, bump=False)
+		self._entries[key] = (bars, tag)
+		self.bytes += bars.nbytes
+		while self.bytes > self.max_bytes:
+			_, (old, _) = self._entries.popitem(last=False)
+			self.bytes -= old.nbytes
+
+	def discard(self, key: tuple[str, str], bump: bool = True) -> None:
+		old = self._entries.pop(key, None)
+		if old is not None:
+			self.bytes -= old[0].nbytes
+		if bump:
+			self._versions[key] = self.version(key) + 1
+
+
+# Per-symbol .bars column files (layout in the README) that every worker maps read-only
+class ColumnFiles:
+	MAGIC = b"BARS"
+	VERSION = 1
+	HEADER = struct.Struct("<4sIQ")
+
+	def __init__(self, root: str):
+		self.root = root
+
+	def path(self, provider: str, symbol: str) -> str:
+		return os.path.join(self.root, provider, quote_url(symbol, safe="") + ".bars")
+
+	def identity(self, provider: str, symbol: str) -> Optional[tuple[int, int, int]]:
+		try:
+			st = os.stat(self.path(provider, symbol))
+		except OSError:
+			return None
+		return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+	def save(self, provider: str, symbol: str, bars: BarSeries) -> None:
+		path = self.path(provider, symbol)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		rows = len(bars)
+		tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+		try:
+			with open(tmp, "wb") as fh:
+				fh.write(self.HEADER.pack(self.MAGIC, self.VERSION, rows))
+				fh.write(bars.days.astype("<i4").tobytes())
+				fh.write(b"\0" * (-4 * rows % 8))
+				for col in _BAR_COLUMNS:
+					fh.write(getattr(bars, col).astype("<f8").tobytes())
+			os.replace(tmp, path)
+		finally:
+			if os.path.exists(tmp):
+				os.remove(tmp)
+
+	def load(self, provider: str, symbol: str) -> Optional[BarSeries]:
+		try:
+			with open(self.path(provider, symbol), "rb") as fh:
+				mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+		except (OSError, ValueError):
+			return None
+		magic, version, rows = self.HEADER.unpack_from(mm, 0)
+		offset = self.HEADER.size + 4 * rows + (-4 * rows % 8)
+		if magic != self.MAGIC or version != self.VERSION or len(mm) != offset + 8 * rows * len(_BAR_COLUMNS):
+			logger.warning(f"Ignoring malformed column file for {provider}:{symbol}")
+			return None
+		days = np.frombuffer(mm, dtype="<i4", count=rows, offset=self.HEADER.size)
+		cols = [np.frombuffer(mm, dtype="<f8", count=rows, offset=offset + 8 * rows * i) for i in range(len(_BAR_COLUMNS))]
+		return BarSeries(days, *cols)
+
+	def remove(self, provider: str, symbol: str) -> bool:
+		try:
+			os.remove(self.path(provider, symbol))
+		except FileNotFoundError:
+			pass
+		except OSError as ex:
+			# Windows refuses to delete a file that is still mapped
+			logger.warning(f"Column file for {provider}:{symbol} could not be removed: {ex}")
+			return False
+		return True
+
+
+COLUMNS_MEDIA_TYPE = "application/vnd.stock-correlation.columns"
+_COLUMNS_MAGIC = b"COLS"
+_COLUMNS_VERSION = 1
+_COLUMNS_HEADER = struct.Struct("<4sIQII")
+
+
+# Binary wire format served as COLUMNS_MEDIA_TYPE (layout in the README); every array is 8-byte aligned
+def encode_columns(meta: dict, days: np.ndarray, columns: dict[str, np.ndarray]) -> bytes:
+	rows = len(days)
+	header = json.dumps(dict(meta, columns=list(columns)), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+	header += b" " * (-len(header) % 8)
+	offset = _COLUMNS_HEADER.size + len(header)
+	body = bytearray(offset + 4 * rows + (-4 * rows % 8) + 8 * rows * len(columns))
+	_COLUMNS_HEADER.pack_into(body, 0, _COLUMNS_MAGIC, _COLUMNS_VERSION, rows, len(columns), len(header))
+	body[_COLUMNS_HEADER.size:offset] = header
+	np.frombuffer(body, dtype="<i4", count=rows, offset=offset)[:] = days
+	offset += 4 * rows + (-4 * rows % 8)
+	for values in columns.values():
+		np.frombuffer(body, dtype="<f8", count=rows, offset=offset)[:] = values
+		offset += 8 * rows
+	return bytes(body)
+
+
+# Inverse of encode_columns: (metadata, int32 days, columns), all views of buf
+def decode_columns(buf) -> tuple[dict, np.ndarray, dict[str, np.ndarray]]:
+	magic, version, rows, ncols, meta_len = _COLUMNS_HEADER.unpack_from(buf, 0)
+	if magic != _COLUMNS_MAGIC or version != _COLUMNS_VERSION:
+		raise ValueError("not a columns payload")
+	offset = _COLUMNS_HEADER.size
+	meta = json.loads(bytes(buf[offset:offset + meta_len]))
+	offset += meta_len
+	days = np.frombuffer(buf, dtype="<i4", count=rows, offset=offset)
+	offset += 4 * rows + (-4 * rows % 8)
+	columns = {}
+	for name in meta.pop("columns")[:ncols]:
+		columns[name] = np.frombuffer(buf, dtype="<f8", count=rows, offset=offset)
+		offset += 8 * rows
+	return meta, days, columns
+
+
+# SQLite store of daily bars plus the date span already requested per (provider, symbol)
+class HistoryStore:
+	def __init__(self, path: str):
+		self.path = path
+		self._lock = threading.Lock()
+		self._conn: Optional[sqlite3.Connection] = None
+
+	def _connect(self) -> sqlite3.Connection:
+		if self._conn is None:
+			folder = os.path.dirname(self.path)
+			if folder:
+				os.makedirs(folder, exist_ok=True)
+			conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+			# WAL lets several uvicorn workers read while one writes
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute("PRAGMA synchronous=NORMAL")
+			conn.executescript(
+				"""
+				CREATE TABLE IF NOT EXISTS bars (
+					provider TEXT NOT NULL,
+					symbol TEXT NOT NULL,
+					date TEXT NOT NULL,
+					open REAL, high REAL, low REAL, close REAL, volume REAL,
+					PRIMARY KEY (provider, symbol, date)
+				) WITHOUT ROWID;
+				CREATE TABLE IF NOT EXISTS coverage (
+					provider TEXT NOT NULL,
+					symbol TEXT NOT NULL,
+					start TEXT NOT NULL,
+					end TEXT NOT NULL,
+					updated REAL NOT NULL,
+					PRIMARY KEY (provider, symbol)
+				);
+				"""
+			)
+			self._conn = conn
+		return self._conn
+
+	# Covered (start, end) span and the epoch time its tail was last fetched
+	def coverage(self, provider: str, symbol: str) -> Optional[tuple[str, str, float]]:
+		with self._lock:
+			row = self._connect().execute(
+				"SELECT start, end, updated FROM coverage WHERE provider = ? AND symbol = ?",
+				(provider, symbol),
+			).fetchone()
+		return (row[0], row[1], row[2]) if row else None
+
+	def read(self, provider: str, symbol: str, start: str, end: str) -> pd.DataFrame:
+		with self._lock:
+			rows = self._connect().execute(
+				"SELECT date, open, high, low, close, volume FROM bars "
+				"WHERE provider = ? AND symbol = ? AND date BETWEEN ? AND ? ORDER BY date",
+				(provider, symbol, start, end),
+			).fetchall()
+		if not rows:
+			return pd.DataFrame()
+		df = pd.DataFrame(rows, columns=["date"] + _BAR_COLUMNS)
+		df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d")
+		return df
+
+	# Every stored bar for (provider, symbol), straight from the rows into arrays
+	def read_series(self, provider: str, symbol: str) -> BarSeries:
+		with self._lock:
+			rows = self._connect().execute(
+				"SELECT date, open, high, low, close, volume FROM bars WHERE provider = ? AND symbol = ? ORDER BY date",
+				(provider, symbol),
+			).fetchall()
+		if not rows:
+			return BarSeries.blank()
+		days = np.array([r[0] for r in rows], dtype="datetime64[D]")
+		fields = np.array([r[1:] for r in rows], dtype=np.float64)  # NULL → NaN
+		return BarSeries.from_arrays((days - _EPOCH_DAY).astype(np.int64), fields)
+
+	# Replace the bars in [start, end] with df; coverage grows by [start, cover_end] so today's bar can stay outside it
+	def write(self, provider: str, symbol: str, df: pd.DataFrame, start: str, end: str, cover_end: Optional[str] = None) -> None:
+		rows = [] if df is None or df.empty or "date" not in df.columns else self._rows(provider, symbol, df)
+		cover_end = end if cover_end is None else cover_end
+		with self._lock:
+			conn = self._connect()
+			with conn:
+				# An empty segment only records coverage (the span before a listing has no bars to fetch)
+				if rows:
+					# The fetched segment is authoritative: drop bars the provider no longer reports
+					conn.execute(
+						"DELETE FROM bars WHERE provider = ? AND symbol = ? AND date BETWEEN ? AND ?",
+						(provider, symbol, start, end),
+					)
+					conn.executemany(
+						"INSERT OR REPLACE INTO bars (provider, symbol, date, open, high, low, close, volume) "
+						"VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+						rows,
+					)
+				if start <= cover_end:
+					row = conn.execute(
+						"SELECT start, end, updated FROM coverage WHERE provider = ? AND symbol = ?",
+						(provider, symbol),
+					).fetchone()
+					span_start, span_end, updated = start, cover_end, time.time()
+					if row:
+						span_start, span_end = min(span_start, row[0]), max(span_end, row[1])
+						# Only a write reaching the covered end refreshes the tail timestamp
+						if end < row[1]:
+							updated = row[2]
+					conn.execute(
+						"INSERT OR REPLACE INTO coverage (provider, symbol, start, end, updated) VALUES (?, ?, ?, ?, ?)",
+						(provider, symbol, span_start, span_end, updated),
+					)
+
+	@staticmethod
+	def _rows(provider: str, symbol: str, df: pd.DataFrame) -> List[tuple]:
+		frame = df.dropna(subset=["date"])
+		if not pd.api.types.is_datetime64_any_dtype(frame["date"]):
+			frame = filter_date_range(frame.copy(), "1900-01-01", "2262-04-11")
+		dates = frame["date"].dt.strftime("%Y-%m-%d")
+		cols = {}
+		for col in _BAR_COLUMNS:
+			series = pd.to_numeric(frame[col], errors="coerce") if col in frame.columns else pd.Series(float("nan"), index=frame.index)
+			series = series.astype("float64").replace([math.inf, -math.inf], math.nan)
+			cols[col] = series.astype(object).where(series.notna(), None)
+		return list(zip(
+			[provider] * len(frame),
+			[symbol] * len(frame),
+			dates,
+			*(cols[c] for c in _BAR_COLUMNS),
+		))
+
+	# Forget everything stored for (provider, symbol)
+	def invalidate(self, provider: str, symbol: str) -> None:
+		with self._lock:
+			conn = self._connect()
+			with conn:
+				conn.execute("DELETE FROM bars WHERE provider = ? AND symbol = ?", (provider, symbol))
+				conn.execute("DELETE FROM coverage WHERE provider = ? AND symbol = ?", (provider, symbol))
+
+
+_history_store: Optional[HistoryStore] = HistoryStore(HISTORY_CACHE_PATH) if HISTORY_CACHE_PATH else None
+_series_cache = SeriesCache(HISTORY_MEMORY_CACHE_MB * 1024 * 1024)
+_column_files: Optional[ColumnFiles] = ColumnFiles(HISTORY_COLUMNS_DIR) if HISTORY_COLUMNS_DIR and _history_store is not None else None
+
+
+def _shift_day(day: str, delta: int) -> str:
+	return (pd.Timestamp(day) + pd.Timedelta(days=delta)).strftime("%Y-%m-%d")
+
+
+def _load_market_zone():
+	try:
+		return ZoneInfo(MARKET_TIMEZONE)
+	except (ZoneInfoNotFoundError, ValueError):
+		logger.warning(f"Unknown MARKET_TIMEZONE '{MARKET_TIMEZONE}'; using UTC")
+		return timezone.utc
+
+
+_MARKET_ZONE = _load_market_zone()
+# Crypto pairs and FX/futures quotes trade outside the session, so their last bar is never settled early
+_ROUND_THE_CLOCK = re.compile(r"(=|-(USD|USDT|USDC|EUR|GBP|JPY|BTC|ETH)$)", re.IGNORECASE)
+
+
+def _session_time(day: date, hhmm: str) -> datetime:
+	hour, minute = (int(x) for x in hhmm.split(":"))
+	return datetime(day.year, day.month, day.day, hour, minute, tzinfo=_MARKET_ZONE)
+
+
+# Most recent weekday MARKET_CLOSE at or before now (exchange holidays are not modelled)
+def _last_session_close(now: datetime) -> datetime:
+	day = now.astimezone(_MARKET_ZONE).date()
+	while True:
+		if day.weekday() < 5:
+			close = _session_time(day, MARKET_CLOSE)
+			if close <= now:
+				return close
+		day -= timedelta(days=1)
+
+
+def _market_is_open(now: datetime) -> bool:
+	local = now.astimezone(_MARKET_ZONE)
+	if local.weekday() >= 5:
+		return False
+	return _session_time(local.date(), MARKET_OPEN) <= local < _session_time(local.date(), MARKET_CLOSE)
+
+
+# Today's date (YYYY-MM-DD) in the market's time zone
+def _market_today(now: Optional[datetime] = None) -> str:
+	return (now or datetime.now(timezone.utc)).astimezone(_MARKET_ZONE).date().isoformat()
+
+
+# True when no session is running and the store holds the last session's bar, fetched after its close
+def _tail_is_settled(symbol: str, covered_end: str, updated: float, last_bar: Optional[str], now: Optional[datetime] = None) -> bool:
+	if _ROUND_THE_CLOCK.search(symbol):
+		return False
+	now = now or datetime.now(timezone.utc)
+	if _market_is_open(now):
+		return False
+	close = _last_session_close(now)
+	session = close.astimezone(_MARKET_ZONE).date()
+	# Coverage stops at yesterday, so the session's own bar sits just past the covered end
+	prior = session - timedelta(days=1)
+	while prior.weekday() >= 5:
+		prior -= timedelta(days=1)
+	if covered_end < prior.isoformat() or updated < close.timestamp():
+		return False
+	# A fetch soon after the close can predate the provider publishing the session's bar
+	return last_bar is not None and last_bar >= session.isoformat()
+
+
+def _next_session_open(now: datetime) -> datetime:
+	day = now.astimezone(_MARKET_ZONE).date()
+	while True:
+		if day.weekday() < 5:
+			opening = _session_time(day, MARKET_OPEN)
+			if opening > now:
+				return opening
+		day += timedelta(days=1)
+
+
+# Historical ranges get HTTP_CACHE_MAX_AGE; a live last bar HTTP_CACHE_LIVE_MAX_AGE; after the close, until the next open
+def _cache_control(end: str, symbols: List[str]) -> str:
+	now = datetime.now(timezone.utc)
+	if end < _last_session_close(now).date().isoformat():
+		max_age = HTTP_CACHE_MAX_AGE
+	elif _market_is_open(now) or any(_ROUND_THE_CLOCK.search(s) for s in symbols):
+		max_age = HTTP_CACHE_LIVE_MAX_AGE
+	else:
+		max_age = max(HTTP_CACHE_LIVE_MAX_AGE, min(HTTP_CACHE_MAX_AGE, int((_next_session_open(now) - now).total_seconds())))
+	return f"public, max-age={max_age}"
+
+
+# Weak (gzip and identity share it) ETag over parts and the raw bytes of arrays
+def _etag(parts: tuple, arrays: tuple = ()) -> str:
+	digest = hashlib.blake2b("\x1f".join(str(p) for p in parts).encode(), digest_size=16)
+	for values in arrays:
+		digest.update(np.ascontiguousarray(values))
+	return f'W/"{digest.hexdigest()}"'
+
+
+# True when the request's If-None-Match already names etag
+def _not_modified(request: Request, etag: str) -> bool:
+	header = request.headers.get("if-none-match")
+	if not header:
+		return False
+	# Weak comparison, as If-None-Match requires
+	tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+	return "*" in tags or etag.removeprefix("W/") in tags
+
+
+# True when the Accept header lists media_type with a non-zero q
+def _accepts(request: Request, media_type: str) -> bool:
+	for part in request.headers.get("accept", "").split(","):
+		media, _, params = part.partition(";")
+		if media.strip().lower() == media_type:
+			return not re.search(r"\bq\s*=\s*0(\.0*)?\s*$", params.strip())
+	return False
+
+
+# Parts of [start, end] to fetch given covered; tail segments re-fetch HISTORY_REFRESH_OVERLAP_DAYS of overlap
+def _missing_ranges(covered: Optional[tuple], start: str, end: str, refresh: bool = False, tail_settled: bool = False) -> List[tuple[str, str]]:
+	if covered is None:
+		return [(start, end)]
+	cs, ce = covered[0], covered[1]
+	missing: List[tuple[str, str]] = []
+	if start < cs:
+		missing.append((start, _shift_day(cs, -1)))
+	if (end > ce and not tail_settled) or refresh:
+		tail_start = max(cs, _shift_day(ce, 1 - HISTORY_REFRESH_OVERLAP_DAYS))
+		missing.append((tail_start, max(end, ce)))
+	return missing
+
+
+# True when closes shared by stored and fetched disagree (splits, back-adjustments)
+def _is_restated(stored: pd.DataFrame, fetched: pd.DataFrame) -> bool:
+	if stored.empty or fetched is None or fetched.empty or "close" not in fetched.columns:
+		return False
+	fresh = fetched[["date", "close"]].dropna()
+	if not pd.api.types.is_datetime64_any_dtype(fresh["date"]):
+		return False
+	joined = stored[["date", "close"]].merge(fresh, on="date", suffixes=("_old", "_new"))
+	if joined.empty:
+		return False
+	old = joined["close_old"].astype("float64")
+	new = pd.to_numeric(joined["close_new"], errors="coerce").astype("float64")
+	rel = ((old - new).abs() / old.abs().clip(lower=1e-12)).fillna(0.0)
+	return bool((rel > HISTORY_RESTATEMENT_TOLERANCE).any())
+
+
+_history_flights = SingleFlight("history")
+
+
+# Bars for symbol in [start, end] from provider through the store; concurrent identical loads share one
+async def load_history(provider: str, symbol: str, start: str, end: str, refresh: bool = False) -> BarSeries:
+	key = (provider, symbol, start, end, bool(refresh))
+	return await _history_flights.run(key, lambda: _load_history(provider, symbol, start, end, refresh))
+
+
+# Every stored bar for (provider, symbol), mapped from its column file when there is one
+async def _stored_series(store: HistoryStore, provider: str, symbol: str) -> BarSeries:
+	key = (provider, symbol)
+	files = _column_files
+	if files is None:
+		bars = _series_cache.get(key)
+		_metrics.inc("history_series_cache_total", result="miss" if bars is None else "hit")
+		if bars is None:
+			version = _series_cache.version(key)
+			bars = await asyncio.to_thread(store.read_series, provider, symbol)
+			_series_cache.put(key, bars, version)
+		return bars
+	# Another worker may have replaced the file since we mapped it; its identity tells
+	ident = files.identity(provider, symbol)
+	if ident is not None:
+		bars = _series_cache.get(key, tag=ident)
+		_metrics.inc("history_series_cache_total", result="miss" if bars is None else "hit")
+		if bars is not None:
+			return bars
+		version = _series_cache.version(key)
+		bars = files.load(provider, symbol)
+		if bars is not None:
+			_series_cache.put(key, bars, version, tag=ident)
+			return bars
+	return await _export_columns(store, provider, symbol)
+
+
+# Rebuild the column file for (provider, symbol) from the store and return its bars
+async def _export_columns(store: HistoryStore, provider: str, symbol: str) -> BarSeries:
+	with span("column_export", provider):
+		key = (provider, symbol)
+		version = _series_cache.version(key)
+		files = _column_files
+		covered = await asyncio.to_thread(store.coverage, provider, symbol) if files is not None else None
+		bars = await asyncio.to_thread(store.read_series, provider, symbol)
+		if files is not None:
+			try:
+				await asyncio.to_thread(files.save, provider, symbol, bars)
+			except OSError as ex:
+				logger.warning(f"Column file write failed for {provider}:{symbol}: {ex}")
+				return bars
+			if await asyncio.to_thread(store.coverage, provider, symbol) != covered:
+				# Another worker wrote while we read; our file may predate its write
+				files.remove(provider, symbol)
+				return bars
+			mapped = files.load(provider, symbol)
+			if mapped is not None:
+				_series_cache.put(key, mapped, version, tag=files.identity(provider, symbol))
+				return mapped
+		return bars
+
+
+async def _load_history(provider: str, symbol: str, start: str, end: str, refresh: bool = False) -> BarSeries:
+	fetcher = HISTORY_FETCHERS.get(provider)
+	if fetcher is None:
+		raise ValueError(f"Unknown provider '{provider}'")
+	store = _history_store
+	if store is None:
+		_metrics.inc("history_cache_requests_total", result="bypass")
+		return BarSeries.from_frame(await fetcher(symbol, start, end))
+	# SQLite calls run in worker threads so a slow disk never stalls the event loop
+	try:
+		with span("cache_lookup", provider):
+			covered = await asyncio.to_thread(store.coverage, provider, symbol)
+	except sqlite3.Error as ex:
+		logger.warning(f"History cache unavailable ({ex}); fetching {provider}:{symbol} directly")
+		_metrics.inc("history_cache_requests_total", result="bypass")
+		return BarSeries.from_frame(await fetcher(symbol, start, end))
+	stored: Optional[BarSeries] = None
+	settled_tail = False
+	if covered is not None and not refresh and end > covered[1]:
+		# A tail fetched up to today less than HTTP_CACHE_LIVE_MAX_AGE ago is served as is, even while the market is open
+		settled_tail = covered[1] >= _shift_day(_market_today(), -1) and time.time() - covered[2] < HTTP_CACHE_LIVE_MAX_AGE
+		if not settled_tail:
+			with span("cache_read", provider):
+				stored = await _stored_series(store, provider, symbol)
+			last_bar = str(stored.dates()[-1]) if not stored.empty else None
+			settled_tail = _tail_is_settled(symbol, covered[1], covered[2], last_bar)
+	missing = _missing_ranges(covered, start, end, refresh=refresh, tail_settled=settled_tail)
+	_metrics.inc("history_cache_requests_total", result="hit" if not missing else "miss" if covered is None else "partial")
+	if not missing:
+		logger.info(f"/history: cache hit for {provider}:{symbol} {start}→{end}")
+		if stored is None:
+			with span("cache_read", provider):
+				stored = await _stored_series(store, provider, symbol)
+		return stored.slice(start, end)
+	# Bars up to yesterday are treated as final; today's bar is always fetched live.
+	settled = _shift_day(_market_today(), -1)
+	fetched: List[tuple[pd.DataFrame, str, str]] = []
+	for seg_start, seg_end in missing:
+		df = await fetcher(symbol, seg_start, seg_end)
+		if df is None or df.empty:
+			if covered is not None and seg_end < covered[0]:
+				# Nothing before the stored span: record the head as covered so it is not asked for again
+				fetched.append((pd.DataFrame(), seg_start, seg_end))
+			continue
+		if covered is not None and seg_end >= covered[1]:
+			overlap = await asyncio.to_thread(store.read, provider, symbol, seg_start, covered[1])
+			if _is_restated(overlap, df):
+				# History was rewritten upstream; the stored span can no longer be trusted
+				logger.info(f"/history: {provider}:{symbol} restated upstream; re-fetching {start}→{end}")
+				await asyncio.shield(_drop_stored(store, provider, symbol))
+				return await _load_history(provider, symbol, start, end)
+		fetched.append((df, seg_start, seg_end))
+	if covered is None and not fetched:
+		return BarSeries.blank()
+	if fetched:
+		# Shielded: a cancelled candidate must not stop between the SQLite write and the column file export
+		bars = (await asyncio.shield(_store_fetched(store, provider, symbol, fetched, settled))).slice(start, end)
+	else:
+		with span("cache_read", provider):
+			bars = (await _stored_series(store, provider, symbol)).slice(start, end)
+	if bars.empty and fetched:
+		# Store could not be written; fall back to what the provider returned
+		frames = [df for df, _, _ in fetched if not df.empty]
+		return BarSeries.from_frame(pd.concat(frames, ignore_index=True) if frames else None).slice(start, end)
+	return bars
+
+
+async def _drop_stored(store: HistoryStore, provider: str, symbol: str) -> None:
+	if _column_files is not None:
+		await asyncio.to_thread(_column_files.remove, provider, symbol)
+	_series_cache.discard((provider, symbol))
+	await asyncio.to_thread(store.invalidate, provider, symbol)
+
+
+async def _store_fetched(store: HistoryStore, provider: str, symbol: str, fetched: List[tuple[pd.DataFrame, str, str]], settled: str) -> BarSeries:
+	# The column file goes before the SQLite write so it can never be older than the coverage it is served under
+	if _column_files is not None and not await asyncio.to_thread(_column_files.remove, provider, symbol):
+		return BarSeries.blank()
+	_series_cache.discard((provider, symbol))
+	for df, seg_start, seg_end in fetched:
+		try:
+			with span("cache_write", provider):
+				await asyncio.to_thread(store.write, provider, symbol, df, seg_start, seg_end, min(seg_end, settled))
+		except sqlite3.Error as ex:
+			logger.warning(f"History cache write failed for {provider}:{symbol}: {ex}")
+	_series_cache.discard((provider, symbol))
+	# New bars landed in the store; republish the column file other workers map
+	return await _export_columns(store, provider, symbol)
+
+
+# Race candidates with hedged starts; the first non-empty one in priority order wins, the rest are cancelled
+async def race_history_candidates(candidates: List[tuple[str, str]], start: str, end: str, refresh: bool = False) -> tuple[Optional[int], BarSeries]:
+	loop = asyncio.get_running_loop()
+	running: dict[asyncio.Task, int] = {}
+	outcomes: dict[int, BarSeries] = {}
+	first_error: Optional[Exception] = None
+	launched = 0
+	best = 0
+	last_launch = -math.inf
+	try:
+		while True:
+			while best in outcomes:
+				if not outcomes[best].empty:
+					return best, outcomes[best]
+				best += 1
+			if best >= len(candidates):
 				break
-			else:
-				errors.append(f"{p}: no data")
+			now = loop.time()
+			while launched < len(candidates) and len(running) < HISTORY_RACE_WIDTH and (not running or now - last_launch >= HISTORY_HEDGE_DELAY):
+				p, sym = candidates[launched]
+				running[asyncio.ensure_future(load_history(p, sym, start, end, refresh=refresh))] = launched
+				launched += 1
+				last_launch = now
+			timeout = None
+			if launched < len(candidates) and len(running) < HISTORY_RACE_WIDTH:
+				timeout = max(0.0, last_launch + HISTORY_HEDGE_DELAY - now)
+			done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+			for task in done:
+				i = running.pop(task)
+				try:
+					df = task.result()
+				except Exception as ex:
+					logger.warning(f"/history: {candidates[i][0]}:{candidates[i][1]} failed: {ex}")
+					first_error = first_error or ex
+					df = None
+				outcomes[i] = df if df is not None else BarSeries.blank()
+	finally:
+		for task in running:
+			task.cancel()
+	if first_error is not None:
+		raise first_error
+	return None, BarSeries.blank()
+
+
+# Resolve one ticker through the provider × symbol-variant chain; returns bars and meta (provider or error)
+async def resolve_history(ticker: str, start: str, end: str, refresh: bool = False, track: bool = True) -> tuple[BarSeries, dict]:
+	if track:
+		_ticker_demand.note(ticker)
+	orig_ticker = ticker
+	ticker = normalize_ticker(ticker)
+	symbol_variants = build_symbol_variants(orig_ticker, ticker)
+
+	start = normalize_date(start)
+	end = normalize_date(end)
+
+	# Decide provider order (prefer Stooq by default to avoid Yahoo blocks on some hosts)
+	providers_env = os.getenv("PROVIDERS", "stooq,yahoo")
+	providers = [p.strip().lower() for p in providers_env.split(",") if p.strip()]
+	# If the normalized ticker requires Yahoo (e.g., '^' indices or FX '=')
+	# then prefer Yahoo first for this request regardless of default order
+	if ticker and (ticker.startswith('^') or '=' in ticker):
+		providers = ["yahoo"] + [p for p in providers if p != "yahoo"]
+	if not providers:
+		providers = ["yahoo", "stooq"]
+	# Providers that keep failing go to the back until their breaker closes
+	providers = _provider_health.order(providers)
+
+	for p in providers:
+		if p not in HISTORY_FETCHERS:
+			logger.warning(f"Unknown provider '{p}' ignored")
+	providers = [p for p in providers if p in HISTORY_FETCHERS]
+	candidates = [(p, sym) for p in providers for sym in symbol_variants]
+	winner, bars = await race_history_candidates(candidates, start, end, refresh=refresh)
+	# Every candidate ahead of the winner came back empty; rank is the variant's place in symbol_variants
+	misses = candidates if winner is None else candidates[:winner]
+	for p, sym in misses:
+		_metrics.inc("history_variant_misses_total", provider=p, rank=str(symbol_variants.index(sym)))
+	if misses:
+		logger.info(f"/history: no data for {orig_ticker} from {', '.join(f'{p}:{sym}' for p, sym in misses)}")
+
+	# If still empty, return graceful error
+	if winner is None:
+		_metrics.inc("history_resolutions_total", provider="none", rank="")
+		errors = [f"{p}: no data" for p in providers]
+		return BarSeries.blank(), {"ticker": ticker, "error": "; ".join(errors) or "no data"}
+	used_provider, used_symbol = candidates[winner]
+	_metrics.inc("history_resolutions_total", provider=used_provider, rank=str(symbol_variants.index(used_symbol)))
+
+	meta = {"ticker": orig_ticker, "provider": used_provider}
+	if used_symbol and used_symbol != orig_ticker:
+		meta["provider_symbol"] = used_symbol
+	return bars, meta
+
+
+# Request counts per ticker for the learned watchlist; halved after every warm-up
+class TickerDemand:
+	def __init__(self, max_entries: int):
+		self.max_entries = max_entries
+		self._counts: Counter[str] = Counter()
+
+	def note(self, ticker: str) -> None:
+		ticker = (ticker or "").strip()
+		if not ticker:
+			return
+		self._counts[ticker] += 1
+		if len(self._counts) > self.max_entries:
+			self._counts = Counter(dict(self._counts.most_common(self.max_entries // 2)))
+
+	def top(self, n: int) -> List[str]:
+		return [t for t, _ in self._counts.most_common(n)] if n > 0 else []
+
+	def decay(self) -> None:
+		self._counts = Counter({t: c // 2 for t, c in self._counts.items() if c > 1})
+
+
+_ticker_demand = TickerDemand(PREFETCH_DEMAND_MAX)
+
+
+def _prefetch_enabled() -> bool:
+	return _history_store is not None and PREFETCH_STARTUP_DELAY >= 0 and (bool(PREFETCH_TICKERS) or PREFETCH_TOP_N > 0)
+
+
+_prefetch_lock = None
+
+
+def _claim_prefetch_lock() -> bool:
+	# Workers sharing a cache directory would each warm the same tickers; the first to lock the file runs the loop
+	global _prefetch_lock
+	path = os.path.join(os.path.dirname(HISTORY_CACHE_PATH) or ".", "prefetch.lock")
+	try:
+		os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+		handle = open(path, "a+")
+	except OSError as ex:
+		logger.warning(f"Prefetch lock {path} unavailable ({ex}); not warming in this worker")
+		return False
+	try:
+		if fcntl is not None:
+			fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
 		else:
-			used_provider = None  # type: ignore[assignment]
+			msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+	except OSError:
+		handle.close()
+		logger.info("Prefetch: another worker runs the warm-up")
+		return False
+	_prefetch_lock = handle
+	return True
+
+
+# PREFETCH_TICKERS followed by the PREFETCH_TOP_N most requested tickers not already listed
+def prefetch_watchlist() -> List[str]:
+	tickers = list(dict.fromkeys(PREFETCH_TICKERS))
+	return tickers + [t for t in _ticker_demand.top(PREFETCH_TOP_N) if t not in tickers]
+
+
+# Bring the stored history of tickers up to today, jittered and PREFETCH_CONCURRENCY at a time
+async def prefetch_history(tickers: List[str]) -> int:
+	end = _market_today()
+	start = _shift_day(end, -PREFETCH_LOOKBACK_DAYS)
+	sem = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+
+	async def warm(ticker: str) -> bool:
+		async with sem:
+			await asyncio.sleep(random.uniform(0, PREFETCH_JITTER))
+			try:
+				bars, _ = await resolve_history(ticker, start, end, track=False)
+			except Exception as ex:
+				logger.warning(f"Prefetch {ticker} failed: {ex}")
+				return False
+			return not bars.empty
 
-		# If still empty, return graceful error
-		if df is None or df.empty:
-			return {"ticker": ticker, "data": [], "error": "; ".join(errors) or "no data"}
+	return sum(await asyncio.gather(*(warm(t) for t in tickers)))
 
-		# Select available columns safely
-		needed_cols = ["date", "open", "high", "low", "close"]
-		for col in needed_cols:
-			if col not in df.columns:
-				logger.warning(f"Missing column '{col}' after provider normalization; returning empty result")
-				return {"ticker": ticker, "data": [], "provider": used_provider}
 
-		# Drop rows with missing OHLC
-		df = df.dropna(subset=["open", "high", "low", "close", "date"])  # type: ignore
+# First weekday MARKET_CLOSE + PREFETCH_DELAY_MINUTES after now
+def _next_prefetch(now: datetime) -> datetime:
+	day = now.astimezone(_MARKET_ZONE).date()
+	while True:
+		if day.weekday() < 5:
+			due = _session_time(day, MARKET_CLOSE) + timedelta(minutes=PREFETCH_DELAY_MINUTES)
+			if due > now:
+				return due
+		day += timedelta(days=1)
 
-		def to_date_str(x):
-			if hasattr(x, "strftime"):
-				return x.strftime("%Y-%m-%d")
-			return str(x)
 
-		def safe_float(x):
-			try:
-				f = float(x)
-			except Exception:
-				return None
-			if math.isnan(f) or math.isinf(f):
-				return None
-			return f
-
-		records: List[dict] = []
-		for _, row in df.iterrows():
-			o = safe_float(row.get("open"))
-			h = safe_float(row.get("high"))
-			l = safe_float(row.get("low"))
-			c = safe_float(row.get("close"))
-			v = safe_float(row.get("volume")) if "volume" in df.columns else None
-			date_val = row.get("date")
-			date_str = to_date_str(date_val) if date_val is not None else ""
-			if o is None or h is None or l is None or c is None or not date_str:
-				continue
-			records.append({
-				"date": date_str,
-				"open": o,
-				"high": h,
-				"low": l,
-				"close": c,
-				"volume": v,
-			})
-
-		result = {"ticker": orig_ticker, "data": records, "provider": used_provider}
-		if used_symbol and used_symbol != orig_ticker:
-			result["provider_symbol"] = used_symbol
-		return result
+# Warm the watchlist shortly after startup, then after every trading session
+async def _prefetch_loop() -> None:
+	delay = PREFETCH_STARTUP_DELAY
+	while True:
+		await asyncio.sleep(delay)
+		tickers = prefetch_watchlist()
+		if tickers:
+			t0 = time.perf_counter()
+			warmed = await prefetch_history(tickers)
+			logger.info(f"Prefetch: {warmed}/{len(tickers)} tickers warmed in {time.perf_counter() - t0:.1f}s")
+			_ticker_demand.decay()
+		now = datetime.now(timezone.utc)
+		delay = (_next_prefetch(now) - now).total_seconds()
+
+
+# Column lists for bars; a NaN volume becomes None
+def history_columns(bars: BarSeries) -> dict[str, list]:
+	cols: dict[str, list] = {"date": np.datetime_as_string(bars.dates(), unit="D").tolist()}
+	for c in ("open", "high", "low", "close"):
+		cols[c] = getattr(bars, c).tolist()
+	cols["volume"] = _array_to_json(bars.volume)
+	return cols
+
+
+def history_records(bars: BarSeries) -> List[dict]:
+	cols = history_columns(bars)
+	keys = list(cols)
+	return [dict(zip(keys, row)) for row in zip(*(cols[k] for k in keys))]
+
+
+# NaN/inf to None so arrays of any shape serialize as strict JSON
+def _array_to_json(values: np.ndarray) -> list:
+	return np.where(np.isfinite(values), values, None).tolist()
+
+
+def _json_bytes(content) -> bytes:
+	if orjson is not None:
+		return orjson.dumps(content)
+	return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+# JSON rendered by orjson when installed, else compact stdlib json
+class FastJSONResponse(JSONResponse):
+	def render(self, content) -> bytes:
+		return _json_bytes(content)
+
+
+# Stream lines as NDJSON; gzip is done here with a flush per line, as GZipMiddleware would buffer them
+def ndjson_response(request: Request, lines: AsyncIterator[dict], headers: Optional[dict] = None) -> StreamingResponse:
+	compress = GZIP_MIN_SIZE >= 0 and "gzip" in request.headers.get("accept-encoding", "")
+
+	async def body():
+		packer = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None
+		async with aclosing(lines):
+			async for item in lines:
+				line = _json_bytes(item) + b"\n"
+				yield packer.compress(line) + packer.flush(zlib.Z_SYNC_FLUSH) if packer else line
+		if packer:
+			yield packer.flush()
+
+	headers = dict(headers or {}, Vary="Accept")
+	if compress:
+		headers["Content-Encoding"] = "gzip"
+		headers["Vary"] = "Accept, Accept-Encoding"
+	return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+
+# Meta line (with the row count), then HISTORY_STREAM_CHUNK rows per line
+async def _history_lines(meta: dict, bars: BarSeries, shape: str) -> AsyncIterator[dict]:
+	yield dict(meta, rows=len(bars))
+	build = history_columns if shape == "columns" else history_records
+	for lo in range(0, len(bars), HISTORY_STREAM_CHUNK):
+		yield {"data": await asyncio.to_thread(build, bars.rows(lo, lo + HISTORY_STREAM_CHUNK))}
+
+
+@app.get("/history")
+async def get_history(
+	request: Request,
+	ticker: str,
+	start: str,
+	end: str,
+	refresh: bool = False,
+	shape: Literal["records", "columns"] = "records",
+	encoding: Literal["json", "columns"] = Query("json", alias="format"),
+):
+	try:
+		with span("resolve"):
+			bars, meta = await resolve_history(ticker, start, end, refresh=refresh)
+		result = {"ticker": meta.pop("ticker"), "data": []}
+		if bars.empty:
+			result.update(meta)
+			return result
+		# Validators come from the resolved bars, so a revalidation skips rendering entirely
+		binary = encoding == "columns" or _accepts(request, COLUMNS_MEDIA_TYPE)
+		stream = not binary and _accepts(request, NDJSON_MEDIA_TYPE)
+		symbol = meta.get("provider_symbol", result["ticker"])
+		last_day = np.datetime_as_string(bars.dates()[-1], unit="D")
+		representation = "binary" if binary else f"ndjson-{shape}" if stream else shape
+		etag = _etag((meta["provider"], symbol, last_day, start, end, representation, len(bars)), (bars.close, bars.volume))
+		cache_control = _cache_control(normalize_date(end), [ticker, symbol])
+		if representation != ("binary" if encoding == "columns" else shape):
+			# Chosen by Accept alone: shared caches that ignore Vary (Cloudflare) must not hand it to other clients
+			cache_control = cache_control.replace("public", "private", 1)
+		headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept"}
+		if _not_modified(request, etag):
+			return Response(status_code=304, headers=headers)
+		if binary:
+			meta["ticker"] = result["ticker"]
+			with span("render"):
+				body = await asyncio.to_thread(encode_columns, meta, bars.days, {c: getattr(bars, c) for c in _BAR_COLUMNS})
+			return Response(body, media_type=COLUMNS_MEDIA_TYPE, headers=headers)
+		if stream:
+			return ndjson_response(request, _history_lines(dict(meta, ticker=result["ticker"]), bars, shape), headers)
+		# Rows are already clean; render directly instead of re-validating each one
+		build = history_columns if shape == "columns" else history_records
+		with span("render"):
+			result["data"] = await asyncio.to_thread(build, bars)
+			result.update(meta)
+			response = FastJSONResponse(result, headers=headers)
+		return response
 	except Exception as e:
 		# Do not leak internal error as 500; return structured message
 		logger.exception(f"/history failed for {ticker}: {e}")
-		return {"ticker": orig_ticker if 'orig_ticker' in locals() else ticker, "data": [], "error": str(e)}
+		return {"ticker": ticker, "data": [], "error": str(e)}
+
+
+# Put field of each ticker's bars side by side on a shared, sorted date index
+def align_history(frames: dict[str, BarSeries], field: str = "close", how: str = "inner") -> pd.DataFrame:
+	columns: dict[str, pd.Series] = {}
+	for label, bars in frames.items():
+		if bars is None or bars.empty:
+			continue
+		columns[label] = pd.Series(bars.field(field), index=bars.index(), name=label)
+	if not columns:
+		return pd.DataFrame()
+	return pd.concat(columns, axis=1, join=how).sort_index()
+
+
+# Resolve tickers HISTORY_BATCH_CONCURRENCY at a time; returns bars, resolved metas and error metas
+async def resolve_many(tickers: List[str], start: str, end: str, refresh: bool = False) -> tuple[dict[str, BarSeries], List[dict], List[dict]]:
+	slots = asyncio.Semaphore(HISTORY_BATCH_CONCURRENCY)
+	# Resolve every ticker concurrently; the slowest one bounds the wall-clock time
+	resolved = await asyncio.gather(*(_resolve_slot(t, start, end, refresh, slots) for t in tickers))
+
+	frames: dict[str, BarSeries] = {}
+	found: List[dict] = []
+	errors: List[dict] = []
+	for t, (bars, meta) in zip(tickers, resolved):
+		if bars.empty:
+			errors.append(meta)
+			continue
+		frames[t] = bars
+		found.append(meta)
+	return frames, found, errors
+
+
+# resolve_history under slots; meta is keyed by the input ticker and carries error when empty
+async def _resolve_slot(t: str, start: str, end: str, refresh: bool, slots: asyncio.Semaphore) -> tuple[BarSeries, dict]:
+	try:
+		async with slots:
+			bars, meta = await resolve_history(t, start, end, refresh=refresh)
+	except Exception as e:
+		logger.exception(f"History lookup failed for {t}: {e}")
+		bars, meta = BarSeries.blank(), {"error": str(e)}
+	meta = dict(meta, ticker=t)
+	if bars.empty:
+		meta.setdefault("error", "no data")
+	return bars, meta
+
+
+# Like resolve_many, yielding each ticker as it resolves; closing early cancels the rest
+async def iter_resolved(tickers: List[str], start: str, end: str, refresh: bool = False) -> AsyncIterator[tuple[BarSeries, dict]]:
+	slots = asyncio.Semaphore(HISTORY_BATCH_CONCURRENCY)
+	tasks = [asyncio.ensure_future(_resolve_slot(t, start, end, refresh, slots)) for t in tickers]
+	try:
+		for next_done in asyncio.as_completed(tasks):
+			yield await next_done
+	finally:
+		for task in tasks:
+			task.cancel()
+
+
+def _unique_tickers(tickers: List[str]) -> List[str]:
+	return list(dict.fromkeys(t.strip() for t in tickers if t and t.strip()))
+
+
+@app.post("/history/batch")
+async def get_history_batch(req: HistoryBatchRequest, request: Request):
+	tickers = _unique_tickers(req.tickers)
+	start = normalize_date(req.start)
+	end = normalize_date(req.end)
+	if not _accepts(request, COLUMNS_MEDIA_TYPE) and _accepts(request, NDJSON_MEDIA_TYPE):
+		return ndjson_response(request, _batch_lines(tickers, start, end, req.field, req.refresh))
+	frames, series, errors = await resolve_many(tickers, start, end, refresh=req.refresh)
+
+	aligned = align_history(frames, field=req.field, how=req.align)
+	if _accepts(request, COLUMNS_MEDIA_TYPE):
+		# One float64 column per resolved ticker, in `series` order, on the shared dates
+		days = (aligned.index.to_numpy(dtype="datetime64[D]") - _EPOCH_DAY).astype(np.int32) if not aligned.empty else np.empty(0, np.int32)
+		empty = np.full(len(days), np.nan)
+		columns = {m["ticker"]: aligned[m["ticker"]].to_numpy(np.float64) if m["ticker"] in aligned.columns else empty for m in series}
+		meta = {"start": start, "end": end, "field": req.field, "series": series, "errors": errors}
+		body = await asyncio.to_thread(encode_columns, meta, days, columns)
+		return Response(body, media_type=COLUMNS_MEDIA_TYPE, headers={"Vary": "Accept"})
+	dates = [d.strftime("%Y-%m-%d") for d in aligned.index] if not aligned.empty else []
+	for item in series:
+		col = aligned[item["ticker"]] if item["ticker"] in aligned.columns else pd.Series(dtype="float64")
+		item["values"] = col.astype(object).where(col.notna(), None).tolist()
+	return {"start": start, "end": end, "field": req.field, "dates": dates, "series": series, "errors": errors}
+
+
+def _batch_line(bars: BarSeries, meta: dict, field: str) -> dict:
+	if bars.empty:
+		return meta
+	return dict(meta, dates=np.datetime_as_string(bars.dates(), unit="D").tolist(), values=_array_to_json(bars.field(field)))
+
+
+# One line per ticker in completion order (own dates, or error), then a done summary
+async def _batch_lines(tickers: List[str], start: str, end: str, field: str, refresh: bool) -> AsyncIterator[dict]:
+	resolved = failed = 0
+	async with aclosing(iter_resolved(tickers, start, end, refresh=refresh)) as results:
+		async for bars, meta in results:
+			if bars.empty:
+				failed += 1
+			else:
+				resolved += 1
+			yield await asyncio.to_thread(_batch_line, bars, meta, field)
+	yield {"done": True, "start": start, "end": end, "field": field, "resolved": resolved, "errors": failed}
+
+
+# ---------------------------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------------------------
+
+def _none_if_nan(x: float) -> Optional[float]:
+	x = float(x)
+	return x if math.isfinite(x) else None
+
+
+# Daily log returns of aligned closes; the first row (no predecessor) is dropped
+def log_returns(prices: pd.DataFrame) -> pd.DataFrame:
+	values = prices.to_numpy(dtype="float64")
+	with np.errstate(divide="ignore", invalid="ignore"):
+		rets = np.diff(np.log(values), axis=0)
+	return pd.DataFrame(rets, index=prices.index[1:], columns=prices.columns)
+
+
+# Pearson r, covariance, OLS alpha/beta (y on x) and volatilities with the frontend's n - 1 estimators
+def pair_stats(x: np.ndarray, y: np.ndarray) -> dict:
+	n = len(x)
+	mx = x.mean()
+	my = y.mean()
+	dx = x - mx
+	dy = y - my
+	sxx = float(dx @ dx)
+	syy = float(dy @ dy)
+	sxy = float(dx @ dy)
+	denom = n - 1
+	var_x = sxx / denom
+	var_y = syy / denom
+	cov_xy = sxy / denom
+	beta = sxy / sxx if sxx > 0 else math.nan
+	pearson = sxy / math.sqrt(sxx * syy) if sxx > 0 and syy > 0 else math.nan
+	return {
+		"observations": n,
+		"pearson": _none_if_nan(pearson),
+		"beta": _none_if_nan(beta),
+		"alpha": _none_if_nan(my - beta * mx),
+		"cov": _none_if_nan(cov_xy),
+		"var_a": _none_if_nan(var_x),
+		"var_b": _none_if_nan(var_y),
+		"vol_a": _none_if_nan(math.sqrt(var_x)),
+		"vol_b": _none_if_nan(math.sqrt(var_y)),
+		"mean_a": _none_if_nan(mx),
+		"mean_b": _none_if_nan(my),
+	}
+
+
+# Response skeleton plus aligned closes and log returns of two tickers; the skeleton carries error when unusable
+async def pair_returns(a: str, b: str, start: str, end: str, refresh: bool = False) -> tuple[dict, pd.DataFrame, pd.DataFrame]:
+	a, b = a.strip(), b.strip()
+	frames, found, errors = await resolve_many(_unique_tickers([a, b]), start, end, refresh=refresh)
+	result = {"a": a, "b": b, "start": start, "end": end}
+	if errors or a == b:
+		result["error"] = "; ".join(f"{e['ticker']}: {e['error']}" for e in errors) or "tickers must differ"
+		return result, pd.DataFrame(), pd.DataFrame()
+	result["providers"] = {m["ticker"]: m.get("provider") for m in found}
+	prices = align_history(frames, field="close", how="inner")
+	result["overlap"] = len(prices)
+	rets = log_returns(prices[[a, b]]) if len(prices) >= 2 else pd.DataFrame()
+	rets = rets[np.isfinite(rets.to_numpy()).all(axis=1)] if not rets.empty else rets
+	if len(rets) < 2:
+		result["error"] = f"Not enough overlapping data (overlap={len(prices)})"
+		return result, pd.DataFrame(), pd.DataFrame()
+	return result, prices[[a, b]], rets
+
+
+# Return-based statistics of b against a (a is the regressor), as in the UI
+@app.get("/correlation")
+async def get_correlation(request: Request, response: Response, a: str, b: str, start: str, end: str, refresh: bool = False):
+	result, prices, rets = await pair_returns(a, b, normalize_date(start), normalize_date(end), refresh=refresh)
+	if rets.empty:
+		return result
+	# The stats are a pure function of the aligned closes, which therefore make the ETag
+	etag = _etag((result["a"], result["b"], result["start"], result["end"], sorted(result["providers"].items())), (prices.index.asi8, prices.to_numpy()))
+	headers = {"ETag": etag, "Cache-Control": _cache_control(result["end"], [result["a"], result["b"]])}
+	if _not_modified(request, etag):
+		return Response(status_code=304, headers=headers)
+	response.headers.update(headers)
+	values = rets.to_numpy()
+	result.update(pair_stats(values[:, 0], values[:, 1]))
+	return result
+
+
+# Rolling stats of y on x from prefix sums, O(n) per window; entry i covers i-window+1..i
+def rolling_pair_stats(x: np.ndarray, y: np.ndarray, windows: List[int]) -> dict[int, dict[str, np.ndarray]]:
+	n = len(x)
+	# Centre first so the prefix sums stay small and the differences stay accurate
+	mx = x.mean()
+	my = y.mean()
+	xc = x - mx
+	yc = y - my
+	prefix = np.zeros((5, n + 1))
+	np.cumsum(np.vstack([xc, yc, xc * xc, yc * yc, xc * yc]), axis=1, out=prefix[:, 1:])
+	# Sums of squares this small are cancellation residue of a flat window, not variance
+	tiny_x = 1e-12 * np.mean(xc * xc)
+	tiny_y = 1e-12 * np.mean(yc * yc)
+	out: dict[int, dict[str, np.ndarray]] = {}
+	for w in windows:
+		sx, sy, sxx, syy, sxy = prefix[:, w:] - prefix[:, :-w]
+		cxx = sxx - sx * sx / w
+		cyy = syy - sy * sy / w
+		cxy = sxy - sx * sy / w
+		flat_x = cxx <= tiny_x * w
+		flat_y = cyy <= tiny_y * w
+		cxx[flat_x] = 0.0
+		cyy[flat_y] = 0.0
+		cxy[flat_x | flat_y] = 0.0
+		with np.errstate(divide="ignore", invalid="ignore"):
+			stats = {
+				"mean_a": sx / w + mx,
+				"mean_b": sy / w + my,
+				"var_a": cxx / (w - 1),
+				"var_b": cyy / (w - 1),
+				"cov": cxy / (w - 1),
+				# Undefined (NaN) when either window is flat
+				"pearson": np.where(flat_x | flat_y, np.nan, np.clip(cxy / np.sqrt(cxx * cyy), -1.0, 1.0)),
+				"beta": np.where(flat_x, np.nan, cxy / cxx),
+			}
+		pad = np.full(w - 1, np.nan)
+		out[w] = {k: np.concatenate([pad, v]) for k, v in stats.items()}
+	return out
+
+
+# Rolling statistics of b against a for one or more window lengths (in return days)
+@app.get("/rolling")
+async def get_rolling(a: str, b: str, start: str, end: str, window: List[int] = Query([30]), refresh: bool = False):
+	windows = sorted(set(window))
+	if len(windows) > ROLLING_MAX_WINDOWS or any(w < 2 for w in windows):
+		raise HTTPException(status_code=422, detail=f"Give 1-{ROLLING_MAX_WINDOWS} windows of at least 2 days")
+	result, _, rets = await pair_returns(a, b, normalize_date(start), normalize_date(end), refresh=refresh)
+	if rets.empty:
+		return result
+	values = rets.to_numpy()
+	usable = [w for w in windows if w <= len(values)]
+	rolled = await asyncio.to_thread(rolling_pair_stats, values[:, 0], values[:, 1], usable)
+	result["dates"] = [d.strftime("%Y-%m-%d") for d in rets.index]
+	result["windows"] = {str(w): {k: _array_to_json(v) for k, v in rolled[w].items()} for w in usable}
+	skipped = [w for w in windows if w not in rolled]
+	if skipped:
+		result["skipped_windows"] = skipped
+	return result
+
+
+# 32-bit FNV-1a over parts joined with '|', identical to hashSeed in main.js
+def hash_seed(parts: List[object]) -> int:
+	h = 2166136261
+	# JS strings are UTF-16, so hash code units rather than code points
+	data = "|".join(str(p) for p in parts).encode("utf-16-le")
+	for i in range(0, len(data), 2):
+		h ^= data[i] | (data[i + 1] << 8)
+		h = (h * 16777619) & 0xFFFFFFFF
+	return h
+
+
+# Correlated GBM paths for A and B after a shock to A, as simulateBPathsGBM in main.js
+def simulate_pair_paths(
+	s0: tuple[float, float],
+	mu: tuple[float, float],
+	sigma: tuple[float, float],
+	rho: float,
+	kappa: float,
+	steps: int,
+	n_paths: int,
+	shock_step: int,
+	shock: float,
+	vol_scale: float,
+	rng: np.random.Generator,
+) -> tuple[np.ndarray, np.ndarray]:
+	# Same draws as one (2, n_paths, steps) call; everything below runs in place so the peak stays near three n_paths × steps arrays
+	z_a = rng.standard_normal((n_paths, steps))
+	z_b = rng.standard_normal((n_paths, steps))
+	paths_a = np.empty((n_paths, steps + 1))
+	t = np.arange(1, steps + 1)
+	scale_b = np.where(t > shock_step, vol_scale, 1.0)
+	# B's draws: rho·z_a + sqrt(1 − rho²)·z_b, using A's output as scratch
+	z_b *= math.sqrt(1.0 - rho * rho)
+	z_b += np.multiply(z_a, rho, out=paths_a[:, 1:])
+	z_b *= sigma[1] * scale_b
+	z_b += mu[1]
+	z_a *= sigma[0]
+	z_a += mu[0]
+	z_a[:, shock_step - 1] += shock
+	z_b[:, shock_step - 1] += kappa * shock
+	paths_a[:, 0] = 0.0
+	np.cumsum(z_a, axis=1, out=paths_a[:, 1:])
+	del z_a
+	paths_b = np.empty((n_paths, steps + 1))
+	paths_b[:, 0] = 0.0
+	np.cumsum(z_b, axis=1, out=paths_b[:, 1:])
+	del z_b
+	for start_price, out in ((s0[0], paths_a), (s0[1], paths_b)):
+		np.exp(out, out=out)
+		out *= start_price
+	return paths_a, paths_b
+
+
+# Monte Carlo of b (and a) after a shock to a, returned as quantile bands
+@app.get("/simulate")
+async def get_simulation(
+	a: str,
+	b: str,
+	start: str,
+	end: str,
+	shock: float = Query(..., description="Log-return shock applied to a, e.g. -0.1"),
+	steps: int = Query(30, ge=1, le=SIM_MAX_STEPS),
+	paths: int = Query(10000, ge=1, le=SIM_MAX_PATHS),
+	shock_step: Optional[int] = Query(None, ge=1),
+	vol_scale: float = Query(1.2, gt=0),
+	quantile: List[float] = Query([0.05, 0.5, 0.95]),
+	seed: Optional[int] = Query(None, ge=0),
+	sample_paths: int = Query(0, ge=0, le=200),
+	refresh: bool = False,
+):
+	if any(not 0.0 <= q <= 1.0 for q in quantile):
+		raise HTTPException(status_code=422, detail="quantiles must be within [0, 1]")
+	if paths * steps > SIM_MAX_DRAWS:
+		raise HTTPException(status_code=422, detail=f"paths × steps must not exceed {SIM_MAX_DRAWS}")
+	shock_step = shock_step if shock_step is not None else max(1, steps // 4)
+	if shock_step > steps:
+		raise HTTPException(status_code=422, detail="shock_step must not exceed steps")
+	start = normalize_date(start)
+	end = normalize_date(end)
+	result, prices, rets = await pair_returns(a, b, start, end, refresh=refresh)
+	if rets.empty:
+		return result
+	values = rets.to_numpy()
+	st = pair_stats(values[:, 0], values[:, 1])
+	var_a, var_b, cov_ab = st["var_a"] or 0.0, st["var_b"] or 0.0, st["cov"] or 0.0
+	rho = cov_ab / math.sqrt(var_a * var_b) if var_a > 0 and var_b > 0 else 0.0
+	rho = max(-0.999, min(0.999, rho))
+	kappa = cov_ab / var_a if var_a > 1e-12 else 0.0
+	if seed is None:
+		seed = hash_seed([result["a"], result["b"], start, end, f"{shock:.6f}", steps, paths, shock_step, f"{rho:.6f}"])
+	s0 = (float(prices.iloc[-1, 0]), float(prices.iloc[-1, 1]))
+
+	def run() -> dict:
+		rng = np.random.default_rng(seed)
+		paths_a, paths_b = simulate_pair_paths(
+			s0,
+			(st["mean_a"], st["mean_b"]),
+			(math.sqrt(max(1e-12, var_a)), math.sqrt(max(1e-12, var_b))),
+			rho, kappa, steps, paths, shock_step, shock, vol_scale, rng,
+		)
+		qs = sorted(set(quantile))
+		out = {
+			"bands": {
+				"a": {str(q): row for q, row in zip(qs, np.quantile(paths_a, qs, axis=0).tolist())},
+				"b": {str(q): row for q, row in zip(qs, np.quantile(paths_b, qs, axis=0).tolist())},
+			},
+			"final_change_pct": {
+				"a": {str(q): v for q, v in zip(qs, np.quantile((paths_a[:, -1] / s0[0] - 1.0) * 100.0, qs).tolist())},
+				"b": {str(q): v for q, v in zip(qs, np.quantile((paths_b[:, -1] / s0[1] - 1.0) * 100.0, qs).tolist())},
+			},
+		}
+		if sample_paths:
+			out["sample_paths"] = {"a": paths_a[:sample_paths].tolist(), "b": paths_b[:sample_paths].tolist()}
+		return out
+
+	result.update({
+		"shock": shock,
+		"steps": steps,
+		"paths": paths,
+		"shock_step": shock_step,
+		"vol_scale": vol_scale,
+		"seed": seed,
+		"rho": rho,
+		"kappa": kappa,
+		"s0": {result["a"]: s0[0], result["b"]: s0[1]},
+	})
+	async with _simulation_slots:
+		result.update(await asyncio.to_thread(run))
+	return result
+
+
+# Log returns of each ticker on its own trading days, outer-joined by date (NaN where it did not trade)
+def series_log_returns(frames: dict[str, BarSeries]) -> pd.DataFrame:
+	columns: dict[str, pd.Series] = {}
+	for label, bars in frames.items():
+		with np.errstate(divide="ignore", invalid="ignore"):
+			rets = np.diff(np.log(bars.close))
+		columns[label] = pd.Series(rets, index=bars.index()[1:])
+	if not columns:
+		return pd.DataFrame()
+	out = pd.concat(columns, axis=1, join="outer").sort_index()
+	return out.where(np.isfinite(out))
+
+
+# Sample covariance and Pearson over pairwise-complete observations from a few T×N matrix products
+def pairwise_cov_corr(returns: np.ndarray, min_periods: int = 2) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+	mask = np.isfinite(returns)
+	m = mask.astype("float64")
+	# Centre each column on its own mean first to keep the raw-moment sums well conditioned
+	col_mean = np.nanmean(np.where(mask, returns, np.nan), axis=0) if returns.size else np.zeros(returns.shape[1])
+	x = np.where(mask, returns - np.nan_to_num(col_mean), 0.0)
+	counts = m.T @ m  # n_ij: observations where both i and j are present
+	sums = x.T @ m  # sums[i, j] = Σ x_i over rows where j is also present
+	sq = (x * x).T @ m  # Σ x_i² over the same rows
+	cross = x.T @ x  # Σ x_i x_j (zeros drop rows where either is missing)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		cov = (cross - sums * sums.T / counts) / (counts - 1)
+		var_i = (sq - sums * sums / counts) / (counts - 1)  # var of i over the pair's rows
+		corr = cov / np.sqrt(var_i * var_i.T)
+	invalid = counts < max(2, min_periods)
+	cov[invalid] = np.nan
+	corr[invalid] = np.nan
+	corr = np.clip(corr, -1.0, 1.0)
+	diag = np.diag_indices_from(corr)
+	corr[diag] = np.where(np.isfinite(np.diag(cov)) & (np.diag(cov) > 0), 1.0, np.nan)
+	return cov, corr, counts
+
+
+@app.post("/correlation/matrix")
+async def get_correlation_matrix(req: CorrelationMatrixRequest):
+	tickers = _unique_tickers(req.tickers)
+	start = normalize_date(req.start)
+	end = normalize_date(req.end)
+	frames, found, errors = await resolve_many(tickers, start, end, refresh=req.refresh)
+	labels = [m["ticker"] for m in found]
+	rets = series_log_returns(frames)
+	result = {"start": start, "end": end, "tickers": labels, "errors": errors}
+	if rets.empty:
+		result.update({"correlation": [], "covariance": [], "observations": []})
+		return result
+	rets = rets[labels]
+	cov, corr, counts = await asyncio.to_thread(pairwise_cov_corr, rets.to_numpy(dtype="float64"), req.min_periods)
+	result.update({
+		"correlation": _array_to_json(corr),
+		"covariance": _array_to_json(cov),
+		"observations": counts.astype("int64").tolist(),
+	})
+	return result
+
+
+# cov if positive definite, else a copy with clipped eigenvalues rescaled to the original variances, and True
+def nearest_psd(cov: np.ndarray) -> tuple[np.ndarray, bool]:
+	sym = (cov + cov.T) / 2.0
+	try:
+		np.linalg.cholesky(sym)
+		return sym, False
+	except np.linalg.LinAlgError:
+		pass
+	w, v = np.linalg.eigh(sym)
+	floor = max(float(w.max()) * 1e-10, 1e-18)
+	fixed = (v * np.clip(w, floor, None)) @ v.T
+	scale = np.sqrt(np.diag(sym) / np.diag(fixed))
+	fixed = fixed * np.outer(scale, scale)
+	return (fixed + fixed.T) / 2.0, True
+
+
+# Lower Cholesky factor of cov after PSD repair; the flag reports whether repair was needed
+def cholesky_factor(cov: np.ndarray) -> tuple[np.ndarray, bool]:
+	fixed, repaired = nearest_psd(cov)
+	jitter = 0.0
+	base = float(np.mean(np.diag(fixed))) or 1.0
+	for _ in range(6):
+		try:
+			return np.linalg.cholesky(fixed + jitter * np.eye(len(fixed))), repaired or jitter > 0
+		except np.linalg.LinAlgError:
+			jitter = base * 1e-10 if jitter == 0.0 else jitter * 100
+	raise ValueError("covariance matrix could not be factorized")
+
+
+# Correlated GBM paths for N assets; pass_through shifts every asset at shock_step, unshocked vols scale afterwards
+def simulate_basket_paths(
+	s0: np.ndarray,
+	mu: np.ndarray,
+	chol: np.ndarray,
+	pass_through: np.ndarray,
+	shocked: np.ndarray,
+	steps: int,
+	n_paths: int,
+	shock_step: int,
+	vol_scale: float,
+	rng: np.random.Generator,
+) -> np.ndarray:
+	n = len(s0)
+	rets = rng.standard_normal((n_paths, steps, n)) @ chol.T
+	vol = np.where(shocked, 1.0, vol_scale)
+	rets[:, shock_step:, :] *= vol
+	rets += mu
+	rets[:, shock_step - 1, :] += pass_through
+	log_path = np.zeros((n_paths, steps + 1, n))
+	np.cumsum(rets, axis=1, out=log_path[:, 1:, :])
+	np.exp(log_path, out=log_path)
+	log_path *= s0
+	return log_path
+
+
+# Shock one or more assets and propagate it conditionally to the rest of the basket
+@app.post("/simulate/basket")
+async def get_basket_simulation(req: BasketSimulationRequest):
+	tickers = _unique_tickers(req.tickers)
+	shocks = {k.strip(): float(v) for k, v in req.shocks.items() if k and k.strip()}
+	unknown = [k for k in shocks if k not in tickers]
+	if unknown or not shocks:
+		raise HTTPException(status_code=422, detail=f"shocks must name tickers in the basket (unknown: {', '.join(unknown) or 'none given'})")
+	if any(not 0.0 <= q <= 1.0 for q in req.quantiles):
+		raise HTTPException(status_code=422, detail="quantiles must be within [0, 1]")
+	shock_step = req.shock_step if req.shock_step is not None else max(1, req.steps // 4)
+	if shock_step > req.steps:
+		raise HTTPException(status_code=422, detail="shock_step must not exceed steps")
+	if req.paths * req.steps * len(tickers) > SIM_MAX_DRAWS:
+		raise HTTPException(status_code=422, detail=f"paths × steps × tickers must not exceed {SIM_MAX_DRAWS}")
+	start = normalize_date(req.start)
+	end = normalize_date(req.end)
+	frames, found, errors = await resolve_many(tickers, start, end, refresh=req.refresh)
+	result = {"start": start, "end": end, "errors": errors}
+	rets = series_log_returns(frames)
+	labels = [m["ticker"] for m in found]
+	cov, _, counts = pairwise_cov_corr(rets[labels].to_numpy(dtype="float64"), req.min_periods) if labels else (np.empty((0, 0)),) * 3
+	# Drop assets without a usable variance; missing cross terms are treated as uncorrelated
+	keep = [i for i, t in enumerate(labels) if np.isfinite(cov[i, i]) and cov[i, i] > 0]
+	for i, t in enumerate(labels):
+		if i not in keep:
+			errors.append({"ticker": t, "error": f"fewer than {req.min_periods} returns"})
+	labels = [labels[i] for i in keep]
+	missing_shocked = [t for t in shocks if t not in labels]
+	if missing_shocked or len(labels) < 2:
+		result["error"] = f"not enough data for: {', '.join(missing_shocked)}" if missing_shocked else "need at least two assets with data"
+		return result
+	cov = np.nan_to_num(cov[np.ix_(keep, keep)], nan=0.0)
+	mu = np.nanmean(rets[labels].to_numpy(dtype="float64"), axis=0)
+	s0 = np.array([float(frames[t].close[-1]) for t in labels])
+	shocked = np.array([t in shocks for t in labels])
+	shock_vec = np.array([shocks[t] for t in labels if t in shocks])
+	seed = req.seed if req.seed is not None else hash_seed(
+		labels + [f"{shocks[t]:.6f}" for t in labels if t in shocks] + [start, end, req.steps, req.paths, shock_step]
+	)
+
+	def run() -> dict:
+		chol, repaired = cholesky_factor(cov)
+		fixed = chol @ chol.T
+		# Conditional mean of the unshocked block given the shock: Σ_US Σ_SS⁻¹ s
+		pass_through = np.zeros(len(labels))
+		pass_through[shocked] = shock_vec
+		pass_through[~shocked] = fixed[np.ix_(~shocked, shocked)] @ np.linalg.lstsq(fixed[np.ix_(shocked, shocked)], shock_vec, rcond=None)[0]
+		prices = simulate_basket_paths(s0, mu, chol, pass_through, shocked, req.steps, req.paths, shock_step, req.vol_scale, np.random.default_rng(seed))
+		qs = sorted(set(req.quantiles))
+		bands = np.quantile(prices, qs, axis=0)  # Q × (steps + 1) × N
+		finals = np.quantile((prices[:, -1, :] / s0 - 1.0) * 100.0, qs, axis=0)  # Q × N
+		return {
+			"psd_repaired": repaired,
+			"pass_through": dict(zip(labels, pass_through.tolist())),
+			"bands": {t: {str(q): bands[k, :, i].tolist() for k, q in enumerate(qs)} for i, t in enumerate(labels)},
+			"final_change_pct": {t: {str(q): float(finals[k, i]) for k, q in enumerate(qs)} for i, t in enumerate(labels)},
+		}
+
+	result.update({
+		"tickers": labels,
+		"shocks": shocks,
+		"steps": req.steps,
+		"paths": req.paths,
+		"shock_step": shock_step,
+		"vol_scale": req.vol_scale,
+		"seed": seed,
+		"s0": dict(zip(labels, s0.tolist())),
+	})
+	async with _simulation_slots:
+		result.update(await asyncio.to_thread(run))
+	return result
+
+
+_suggest_flights = SingleFlight("suggest")
 
 
 @app.get("/suggest")
-def suggest(q: str = Query(..., min_length=1, max_length=24), limit: int = Query(12, ge=1, le=40)):
-	key = (q.lower(), limit)
-	now = time.time()
-	cached = _suggestion_cache.get(key)
-	if cached and now - cached[0] < SUGGESTION_CACHE_TTL:
-		return {"query": q, "data": cached[1], "cached": True}
+async def suggest(q: str = Query(..., min_length=1, max_length=24), limit: int = Query(12, ge=1, le=SUGGESTION_MAX_LIMIT)):
+	with span("suggest_cache"):
+		cached = _suggestion_cache.get(q, limit)
+	if cached is not None:
+		_metrics.inc("suggest_requests_total", source="cache")
+		return {"query": q, "data": cached, "cached": True}
+	with span("suggest_local"):
+		await _symbol_index.maybe_reload()
+		local = _symbol_index.search(q, limit)
+	if len(local) >= limit:
+		# The local directory fills the list; upstream is only asked to backfill sparse queries
+		_metrics.inc("suggest_requests_total", source="local")
+		return {"query": q, "data": [Suggestion(**item).dict() for item in local], "local": True}
+	_metrics.inc("suggest_requests_total", source="upstream")
+	key = (q.strip().lower(),)
 	try:
-		items = fetch_suggestions(q, limit)
+		with span("suggest_upstream"):
+			validated = await _suggest_flights.run(key, lambda: _fetch_and_cache_suggestions(q))
 	except HTTPException:
 		raise
 	except Exception as exc:
 		logger.warning("Suggestion lookup failed for %s: %s", q, exc)
 		raise HTTPException(status_code=502, detail="Suggestion lookup failed")
+	return {"query": q, "data": validated[:limit]}
+
+
+async def _fetch_and_cache_suggestions(q: str) -> List[dict]:
+	# Always fetch the widest list so later requests with any limit are cache hits
+	def store_late(items: List[dict], complete: bool) -> None:
+		_suggestion_cache.put(q, [Suggestion(**item).dict() for item in items], complete)
+
+	items, complete = await collect_suggestions(q, SUGGESTION_MAX_LIMIT, on_late=store_late)
 	validated = [Suggestion(**item).dict() for item in items]
-	_suggestion_cache[key] = (now, validated)
-	return {"query": q, "data": validated}
+	_suggestion_cache.put(q, validated, complete)
+	return validated
+
+
+@app.get("/suggest/stats")
+def suggest_stats():
+	return {**_suggestion_cache.stats(), "indexed_symbols": len(_symbol_index)}
 
 
 if __name__ == "__main__":
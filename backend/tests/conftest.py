@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Tests install their own store; keep import-time setup off the real cache and scheduler
+os.environ.setdefault("HISTORY_CACHE_PATH", "")
+os.environ.setdefault("PREFETCH_STARTUP_DELAY", "-1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,134 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+import main
+
+# Saturday 2026-10-17, 12:00 in New York: the last session closed Friday 2026-10-16 16:00
+SATURDAY = datetime(2026, 10, 17, 16, 0, tzinfo=timezone.utc)
+FRIDAY_CLOSE = datetime(2026, 10, 16, 20, 0, tzinfo=timezone.utc).timestamp()
+
+
+def bars(start: str, end: str) -> pd.DataFrame:
+	dates = pd.bdate_range(start, end)
+	px = [float(d.toordinal() % 1000) for d in dates]
+	return pd.DataFrame({"date": dates, "open": px, "high": px, "low": px, "close": px, "volume": 1.0})
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+	calls = []
+
+	async def fetch(symbol, s, e):
+		calls.append((s, e))
+		return bars(s, e)
+
+	monkeypatch.setitem(main.HISTORY_FETCHERS, "stub", fetch)
+	monkeypatch.setattr(main, "_history_store", main.HistoryStore(str(tmp_path / "h.sqlite3")))
+	monkeypatch.setattr(main, "_column_files", main.ColumnFiles(str(tmp_path / "columns")))
+	monkeypatch.setattr(main, "_series_cache", main.SeriesCache(1 << 20))
+	# Market closed, as on a weekend, whatever day the tests run
+	monkeypatch.setattr(main, "_market_is_open", lambda now: False)
+	return calls
+
+
+def test_settled_tail_requires_recent_coverage():
+	assert main._tail_is_settled("AAPL", "2026-10-15", FRIDAY_CLOSE + 60, "2026-10-16", now=SATURDAY)
+	# Coverage reaches Thursday but Friday's bar was not published yet when the tail was fetched
+	assert not main._tail_is_settled("AAPL", "2026-10-15", FRIDAY_CLOSE + 60, "2026-10-15", now=SATURDAY)
+	assert not main._tail_is_settled("AAPL", "2026-10-15", FRIDAY_CLOSE + 60, None, now=SATURDAY)
+	# Written after the close, but the stored span ends months ago
+	assert not main._tail_is_settled("AAPL", "2020-06-30", FRIDAY_CLOSE + 60, "2026-10-16", now=SATURDAY)
+	# Reaches the session but was fetched before its close
+	assert not main._tail_is_settled("AAPL", "2026-10-16", FRIDAY_CLOSE - 60, "2026-10-16", now=SATURDAY)
+	assert not main._tail_is_settled("BTC-USD", "2026-10-16", FRIDAY_CLOSE + 60, "2026-10-16", now=SATURDAY)
+
+
+def test_missing_ranges():
+	covered = ("2020-01-01", "2020-06-30", 0.0)
+	assert main._missing_ranges(covered, "2020-02-01", "2020-03-01") == []
+	assert main._missing_ranges(None, "2020-01-01", "2020-12-31") == [("2020-01-01", "2020-12-31")]
+	tail = main._shift_day("2020-06-30", 1 - main.HISTORY_REFRESH_OVERLAP_DAYS)
+	assert main._missing_ranges(covered, "2020-01-01", "2020-12-31") == [(tail, "2020-12-31")]
+	assert main._missing_ranges(covered, "2019-12-01", "2020-03-01") == [("2019-12-01", "2019-12-31")]
+	assert main._missing_ranges(covered, "2020-01-01", "2020-12-31", tail_settled=True) == []
+
+
+def test_extending_an_old_range_fetches_the_tail(store):
+	first = asyncio.run(main.load_history("stub", "AAA", "2020-01-01", "2020-06-30"))
+	assert str(first.dates()[-1]) == "2020-06-30"
+	second = asyncio.run(main.load_history("stub", "AAA", "2020-01-01", "2020-12-31"))
+	assert len(store) == 2
+	assert str(second.dates()[-1]) == "2020-12-31"
+	later = asyncio.run(main.load_history("stub", "AAA", "2021-02-01", "2021-03-31"))
+	assert not later.empty and str(later.dates()[0]) == "2021-02-01"
+
+
+def test_cancelled_load_does_not_leave_a_stale_column_file(store, monkeypatch):
+	asyncio.run(main.load_history("stub", "AAA", "2020-01-01", "2020-06-30"))
+	write = main._history_store.write
+
+	def slow_write(*args):
+		time.sleep(0.2)
+		write(*args)
+
+	monkeypatch.setattr(main._history_store, "write", slow_write)
+
+	async def cancel_mid_write():
+		task = asyncio.ensure_future(main.load_history("stub", "AAA", "2020-01-01", "2020-12-31"))
+		await asyncio.sleep(0.05)
+		task.cancel()
+		with pytest.raises(asyncio.CancelledError):
+			await task
+		await asyncio.sleep(0.5)
+
+	asyncio.run(cancel_mid_write())
+	fetches = len(store)
+	again = asyncio.run(main.load_history("stub", "AAA", "2020-01-01", "2020-12-31"))
+	assert str(again.dates()[-1]) == "2020-12-31"
+	assert len(store) == fetches
+
+
+def test_failed_column_export_falls_back_to_the_store(store, monkeypatch):
+	asyncio.run(main.load_history("stub", "AAA", "2020-01-01", "2020-06-30"))
+
+	def refuse(*args):
+		raise PermissionError("mapped elsewhere")
+
+	monkeypatch.setattr(main._column_files, "save", refuse)
+	asyncio.run(main.load_history("stub", "AAA", "2020-01-01", "2020-12-31"))
+	again = asyncio.run(main.load_history("stub", "AAA", "2020-01-01", "2020-12-31"))
+	assert str(again.dates()[-1]) == "2020-12-31"
+
+
+def test_empty_head_is_recorded_as_covered(store, monkeypatch):
+	listed = "2018-01-01"
+
+	async def young(symbol, s, e):
+		store.append((s, e))
+		return bars(max(s, listed), e) if e >= listed else pd.DataFrame()
+
+	monkeypatch.setitem(main.HISTORY_FETCHERS, "stub", young)
+	asyncio.run(main.load_history("stub", "AAA", "2016-01-01", "2020-12-31"))
+	for _ in range(3):
+		series = asyncio.run(main.load_history("stub", "AAA", "2010-01-01", "2020-12-31"))
+		assert str(series.dates()[0]) == "2018-01-01"
+	assert store == [("2016-01-01", "2020-12-31"), ("2010-01-01", "2015-12-31")]
+	assert main._history_store.coverage("stub", "AAA")[0] == "2010-01-01"
+
+
+def test_live_tail_is_refetched_at_most_once_per_ttl(store, monkeypatch):
+	monkeypatch.setattr(main, "_market_is_open", lambda now: True)
+	today = main._market_today()
+	start = main._shift_day(today, -60)
+	for _ in range(4):
+		asyncio.run(main.load_history("stub", "AAA", start, today))
+	assert len(store) == 1
+	asyncio.run(main.load_history("stub", "AAA", start, today, refresh=True))
+	assert len(store) == 2
+	monkeypatch.setattr(main, "HTTP_CACHE_LIVE_MAX_AGE", 0)
+	asyncio.run(main.load_history("stub", "AAA", start, today))
+	assert len(store) == 3
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client(monkeypatch):
+	dates = pd.bdate_range("2020-01-01", "2020-03-31")
+	bars = main.BarSeries.from_frame(pd.DataFrame({"date": dates, "open": 1.0, "high": 1.0, "low": 1.0, "close": 1.0, "volume": 1.0}))
+
+	async def resolve(ticker, start, end, refresh=False, track=True):
+		return bars, {"ticker": ticker, "provider": "stooq", "provider_symbol": ticker.lower()}
+
+	monkeypatch.setattr(main, "resolve_history", resolve)
+	return TestClient(main.app)
+
+
+def test_binary_is_selected_by_the_url(client):
+	params = {"ticker": "AAA", "start": "2020-01-01", "end": "2020-03-31"}
+	plain = client.get("/history", params=params)
+	assert plain.headers["content-type"].startswith("application/json")
+	assert plain.headers["cache-control"].startswith("public")
+	binary = client.get("/history", params=dict(params, format="columns"))
+	assert binary.headers["content-type"] == main.COLUMNS_MEDIA_TYPE
+	assert binary.headers["cache-control"].startswith("public")
+	meta, days, _ = main.decode_columns(binary.content)
+	assert meta["ticker"] == "AAA" and len(days) == 65
+	# Negotiated through Accept only: a shared cache keyed on the URL must not keep it
+	negotiated = client.get("/history", params=params, headers={"Accept": main.COLUMNS_MEDIA_TYPE})
+	assert negotiated.headers["content-type"] == main.COLUMNS_MEDIA_TYPE
+	assert negotiated.headers["cache-control"].startswith("private")
+	streamed = client.get("/history", params=params, headers={"Accept": main.NDJSON_MEDIA_TYPE})
+	assert streamed.headers["cache-control"].startswith("private")
@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+import main
+
+
+def test_flat_windows_are_undefined():
+	rng = np.random.default_rng(0)
+	x = rng.normal(0, 0.01, 400)
+	y = 0.5 * x + rng.normal(0, 0.01, 400)
+	y[100:250] = 0.0  # a policy rate that did not move
+	x[300:360] = 0.003  # constant returns leave centring residue
+	stats = main.rolling_pair_stats(x, y, [30])[30]
+	expected = pd.Series(x).rolling(30).corr(pd.Series(y)).to_numpy()
+	assert not (stats["pearson"] == 1.0).any()
+	assert np.isnan(stats["pearson"][129:250]).all()
+	assert np.isnan(stats["beta"][329:360]).all()
+	defined = ~np.isnan(stats["pearson"])
+	assert np.isnan(stats["pearson"][np.isnan(expected)]).all()
+	assert np.allclose(stats["pearson"][defined], expected[defined], atol=1e-9)
+	assert (stats["var_b"][129:250] == 0.0).all()
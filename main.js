@@ -189,12 +189,48 @@ async function resolveApiBase(){
 	return RESOLVED_API_BASE;
 }
 
+// Binary history payload (see encode_columns in backend/main.py): 24-byte header, JSON metadata,
+// int32 day numbers, then one float64 array per column, each 8-byte aligned so the typed arrays view the buffer directly
+const COLUMNS_MEDIA_TYPE = 'application/vnd.stock-correlation.columns';
+function decodeColumns(buf) {
+	const view = new DataView(buf);
+	const magic = String.fromCharCode(...new Uint8Array(buf, 0, 4));
+	if (magic !== 'COLS' || view.getUint32(4, true) !== 1) throw new Error('Malformed binary response');
+	const rows = Number(view.getBigUint64(8, true));
+	const metaLen = view.getUint32(20, true);
+	const meta = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, 24, metaLen)));
+	let offset = 24 + metaLen;
+	const days = new Int32Array(buf, offset, rows);
+	offset += Math.ceil(rows / 2) * 8;
+	const columns = {};
+	for (const name of meta.columns) {
+		columns[name] = new Float64Array(buf, offset, rows);
+		offset += rows * 8;
+	}
+	return { meta, days, columns };
+}
+
+function columnsToHistory({ meta, days, columns }) {
+	const { open, high, low, close, volume } = columns;
+	const data = new Array(days.length);
+	for (let i = 0; i < days.length; i++) {
+		data[i] = {
+			date: new Date(days[i] * 86400000).toISOString().slice(0,10),
+			open: open[i], high: high[i], low: low[i], close: close[i],
+			volume: Number.isFinite(volume[i]) ? volume[i] : null,
+		};
+	}
+	return { ...meta, data };
+}
+
 async function fetchStock(ticker, start, end) {
 		const base = await resolveApiBase();
-		const url = `${base}/history?ticker=${encodeURIComponent(ticker)}&start=${encodeURIComponent(start)}&end=${encodeURIComponent(end)}`;
-		const res = await fetch(url, { mode: 'cors', cache: 'no-store' });
+		const url = `${base}/history?ticker=${encodeURIComponent(ticker)}&start=${encodeURIComponent(start)}&end=${encodeURIComponent(end)}&format=columns`;
+		const res = await fetch(url, { mode: 'cors', cache: 'no-cache', headers: { Accept: `${COLUMNS_MEDIA_TYPE}, application/json;q=0.9` } });
 		if (!res.ok) throw new Error(`Backend error ${res.status}`);
-		const json = await res.json();
+		// Errors and older backends answer with JSON
+		const binary = (res.headers.get('content-type') || '').startsWith(COLUMNS_MEDIA_TYPE);
+		const json = binary ? columnsToHistory(decodeColumns(await res.arrayBuffer())) : await res.json();
 		if (json && json.error) throw new Error(json.error);
 		if (!json || !Array.isArray(json.data)) throw new Error('Malformed backend response');
 		const cleaned = json.data.map(r => ({
@@ -329,8 +365,7 @@ const shock = parseFloat($('shock').value)/100;
 const windowSize = Math.max(5, parseInt($('window').value||'30',10));
 
 
-const tsA = await fetchStock(tickerA,start,end);
-const tsB = await fetchStock(tickerB,start,end);
+const [tsA, tsB] = await Promise.all([fetchStock(tickerA,start,end), fetchStock(tickerB,start,end)]);
 
 // Quick diagnostics
 const datesA = new Set(tsA.map(d=>d.date));